@@ -0,0 +1,113 @@
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame, Series
+
+from hub_datatools.lookup import load_lookup, lookup_values
+from hub_datatools.serialize import load_data, save_data, try_load_data
+
+CODES_PREFIX = 'codes'
+
+# NOTE: diagnoses tables indexed by their codes, given the episodes table used
+# to link their episodes to patients
+CODE_INDEX_TABLES = {
+    'hub_urg/diagnoses': {'code': 'codigo_dx', 'episodes': 'hub_urg/episodes', 'lookup': 'nhc'},
+    'hub_hosp/diagnoses': {'code': 'codigo_dx', 'episodes': 'hub_hosp/episodes', 'lookup': 'nhc'},
+}
+
+EPISODE_ID_COLUMN = 'id_episodio'
+
+PATIENT_ID_COLUMN = 'id_paciente'
+
+
+def _codes_name(name: str) -> str:
+    return f'{CODES_PREFIX}/{name}'
+
+
+def normalize_codes(codes: Any) -> Series:
+    # NOTE: codes read as numbers, e.g. ICD-9 codes such as 335.2, are converted
+    # to strings instead of being dropped; separators are removed on purpose, as
+    # diagnosis codes place them at a fixed position and sources disagree on
+    # whether to write them, so J96.0 and J960 are the same code
+    codes = Series(codes, dtype=object).astype('string')
+    return codes.str.upper().str.replace(r'[\s.]', '', regex=True)
+
+
+def parse_code_patterns(patterns: Sequence[str]) -> Tuple[Sequence[str], Sequence[str]]:
+    prefixes = [pattern[:-1] for pattern in patterns if pattern.endswith('*')]
+    codes = [pattern for pattern in patterns if not pattern.endswith('*')]
+    return list(normalize_codes(prefixes)), list(normalize_codes(codes))
+
+
+def _try_load_lookup(datadir: Path, column: str) -> Optional[Series]:
+    try:
+        return load_lookup(datadir, column)
+    except FileNotFoundError:
+        return None
+
+
+def _build_code_index(datadir: Path, df: DataFrame, spec: Dict[str, str]) -> DataFrame:
+    index = df.index.to_frame(index=False)
+    index = DataFrame({
+        'codigo': normalize_codes(index[spec['code']]).to_numpy(),
+        EPISODE_ID_COLUMN: index[EPISODE_ID_COLUMN].to_numpy(),
+    })
+
+    # NOTE: codes are indexed by episode even without patient data, e.g. for
+    # snapshots holding only HUB data, and are only linked to patients if any
+    episodes = try_load_data(datadir, spec['episodes'])
+    lookup = _try_load_lookup(datadir, spec['lookup']) if episodes is not None else None
+    if lookup is not None:
+        patients = lookup_values(lookup, episodes[spec['lookup']], validate='many_to_one')
+        positions = episodes.index.get_indexer(index[EPISODE_ID_COLUMN])
+        index[PATIENT_ID_COLUMN] = patients.array.take(positions, allow_fill=True)
+
+    index = index[index.codigo.notna() & (index.codigo != '')]
+    return index.sort_values(['codigo', EPISODE_ID_COLUMN], kind='stable', ignore_index=True)
+
+
+def build_code_indexes(datadir: Path) -> None:
+    for name, spec in CODE_INDEX_TABLES.items():
+        df = try_load_data(datadir, name)
+        if df is not None:
+            save_data(datadir, {_codes_name(name): _build_code_index(datadir, df, spec)}, replace=True)
+
+
+class CodeIndex:
+
+    def __init__(self, index: DataFrame):
+        self._index = index
+        self._codes = index.codigo.to_numpy(dtype=str)
+
+    @staticmethod
+    def load(datadir: Path, name: str) -> 'CodeIndex':
+        return CodeIndex(load_data(datadir, _codes_name(name)))
+
+    def _ranges(self, prefixes: Sequence[str], codes: Sequence[str]) -> np.ndarray:
+        # NOTE: codes are sorted, so rows for a code or prefix form a contiguous
+        # range found by binary search; a prefix ends before the first code that
+        # is greater than any code starting with it
+        prefixes = np.asarray(prefixes, dtype=str)
+        codes = np.asarray(codes, dtype=str)
+        lo = np.concatenate([np.searchsorted(self._codes, prefixes, side='left'),
+                             np.searchsorted(self._codes, codes, side='left')])
+        hi = np.concatenate([np.searchsorted(self._codes, np.char.add(prefixes, '\U0010ffff'), side='left'),
+                             np.searchsorted(self._codes, codes, side='right')])
+
+        counts = hi - lo
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.unique(np.repeat(lo, counts) + offsets)
+
+    def query(self, patterns: Sequence[str]) -> DataFrame:
+        prefixes, codes = parse_code_patterns(patterns)
+        return self._index.iloc[self._ranges(prefixes, codes)]
+
+    def episodes(self, patterns: Sequence[str]) -> np.ndarray:
+        return np.unique(self.query(patterns)[EPISODE_ID_COLUMN].to_numpy())
+
+    def patients(self, patterns: Sequence[str]) -> np.ndarray:
+        matched = self.query(patterns)
+        if PATIENT_ID_COLUMN not in matched.columns:
+            return np.array([])
+        return np.unique(matched[PATIENT_ID_COLUMN].dropna().to_numpy())
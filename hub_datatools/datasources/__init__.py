@@ -2,14 +2,18 @@ from argparse import ArgumentParser, Namespace
 from abc import ABC, abstractmethod, abstractstaticmethod
 from pathlib import Path
 from importlib import import_module
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
 
-
-from pandas import DataFrame
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
 
 class DataSource(ABC):
 
+    # NOTE: incremental data sources merge new data into the tables already in
+    # the snapshot, so they replace them even if replacing was not requested
+    incremental: bool = False
+
     @abstractstaticmethod
     def add_arguments(parser: ArgumentParser) -> None:
         pass
@@ -18,10 +22,38 @@ class DataSource(ABC):
     def is_active(args: Namespace) -> bool:
         pass
 
-    @abstractmethod
-    def load_data(self, args: Namespace) -> Dict[str, DataFrame]:
-        pass
-
+    # NOTE: data sources must override at least one of load_data or iter_data,
+    # as each one is implemented in terms of the other by default
+    def _check_overridden(self) -> None:
+        cls = type(self)
+        if cls.load_data is DataSource.load_data and cls.iter_data is DataSource.iter_data:
+            raise NotImplementedError(f'{cls.__name__} must implement load_data or iter_data')
+
+    def load_data(self, args: Namespace) -> Dict[str, 'DataFrame']:
+        self._check_overridden()
+        import pandas as pd
+
+        results = {}
+        for name, chunk in self.iter_data(args):
+            results.setdefault(name, []).append(chunk)
+        return {name: chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+                for name, chunks in results.items()}
+
+    def iter_data(self, args: Namespace) -> Iterator[Tuple[str, 'DataFrame']]:
+        self._check_overridden()
+        data = self.load_data(args)
+        while data:
+            yield data.popitem()
+
+
+# NOTE: data source modules are only imported once they are selected, so that
+# CLI startup does not pay for importing every data source and its dependencies
+DATASOURCE_MODULES = {
+    'ufmn': 'hub_datatools.datasources.ufmn',
+    'hub_hosp': 'hub_datatools.datasources.hub_hosp',
+    'hub_urg': 'hub_datatools.datasources.hub_urg',
+    'edmus': 'hub_datatools.datasources.edmus',
+}
 
 _registered_datasources: Dict[str, type[DataSource]] = dict()
 
@@ -35,10 +67,14 @@ def datasource(name: str):
 
 
 def get_datasource_names() -> List[str]:
-    return _registered_datasources.keys()
+    names = list(DATASOURCE_MODULES.keys())
+    names += [name for name in _registered_datasources.keys() if name not in names]
+    return names
 
 
 def get_datasource_class(name: str) -> Optional[type[DataSource]]:
+    if name not in _registered_datasources and name in DATASOURCE_MODULES:
+        import_module(DATASOURCE_MODULES[name])
     return _registered_datasources.get(name)
 
 
@@ -0,0 +1,30 @@
+from typing import Dict, Sequence, Tuple
+
+import pandas as pd
+from pandas import DataFrame
+
+
+def split_episodes_and_diagnoses(df: DataFrame, episode_id_column: str,
+                                 episode_columns: Dict[str, str], diagnoses_columns: Dict[str, str],
+                                 ffill_columns: Sequence[str], date_columns: Sequence[str],
+                                 dropna_how: str = 'any') -> Tuple[DataFrame, DataFrame]:
+    # NOTE: sheets have one row per diagnosis, with episode data only present on the
+    # first row of each episode, so ffill is done in place on the (private) sheet and
+    # both tables are then projected from it without copying the full frame
+    df[ffill_columns] = df[ffill_columns].ffill()
+
+    # NOTE: episodes keep every other sheet column, named as in the sheet, as
+    # found on the first row of each episode
+    first_rows = ~df[episode_id_column].duplicated()
+    episodes = df.loc[first_rows].rename(columns=episode_columns)
+    for col in date_columns:
+        episodes[episode_columns[col]] = pd.to_datetime(episodes[episode_columns[col]])
+    episodes.set_index(episode_columns[episode_id_column], inplace=True)
+    episodes.dropna(how=dropna_how, inplace=True)
+
+    diagnoses = (df.loc[:, list(diagnoses_columns.keys())]
+                 .rename(columns=diagnoses_columns)
+                 .set_index(['id_episodio', 'codigo_dx'])
+                 .dropna(how=dropna_how))
+
+    return episodes, diagnoses
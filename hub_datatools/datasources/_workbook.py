@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import pickle
+from importlib.util import find_spec
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from pandas import DataFrame, ExcelFile
+
+
+# NOTE: calamine parses xlsx files much faster than openpyxl, but it is an optional
+# dependency; pandas falls back to openpyxl in read-only (streaming) mode otherwise
+EXCEL_ENGINE = 'calamine' if find_spec('python_calamine') is not None else None
+
+_open_workbooks: Dict[Path, ExcelFile] = dict()
+_loaded_sheets: Dict[Tuple[Path, int | str, int], DataFrame] = dict()
+_file_digests: Dict[Path, str] = dict()
+_workbook_locks: Dict[Path, Lock] = dict()
+_workbook_locks_lock = Lock()
+
+
+def _workbook_lock(path: Path) -> Lock:
+    with _workbook_locks_lock:
+        return _workbook_locks.setdefault(path, Lock())
+
+
+def _file_digest(path: Path) -> str:
+    digest = _file_digests.get(path)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = _file_digests[path] = h.hexdigest()
+    return digest
+
+
+def _cached_sheet_path(cachedir: Path, path: Path, sheet_name: int | str, header: int) -> Path:
+    key = f'{_file_digest(path)}:{sheet_name!r}:{header}'
+    name = hashlib.sha256(key.encode()).hexdigest()
+    return Path(cachedir).joinpath(f'{name}.pickle')
+
+
+def _try_load_cached_sheet(path: Path) -> Optional[DataFrame]:
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (IOError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _save_cached_sheet(path: Path, df: DataFrame) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmppath = path.with_suffix('.tmp')
+    with open(tmppath, 'wb') as f:
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmppath.replace(path)
+
+
+def _open_workbook(path: Path) -> ExcelFile:
+    workbook = _open_workbooks.get(path)
+    if workbook is None:
+        logging.info(f'Opening Excel workbook "{path.name}"')
+        try:
+            workbook = ExcelFile(path, engine=EXCEL_ENGINE)
+        except ValueError:
+            workbook = ExcelFile(path)
+        _open_workbooks[path] = workbook
+    return workbook
+
+
+def _read_excel_sheet(path: Path, sheet_name: int | str, header: int, cachedir: Optional[Path]) -> DataFrame:
+    key = (path, sheet_name, header)
+    df = _loaded_sheets.get(key)
+    if df is None:
+        cachepath = None
+        if cachedir is not None:
+            cachepath = _cached_sheet_path(cachedir, path, sheet_name, header)
+            df = _try_load_cached_sheet(cachepath)
+
+        if df is None:
+            df = pd.read_excel(_open_workbook(path), sheet_name=sheet_name, header=header)
+            if cachepath is not None:
+                _save_cached_sheet(cachepath, df)
+        else:
+            logging.info(f'Using cached copy of "{path.name}" sheet {sheet_name!r}')
+
+        _loaded_sheets[key] = df
+
+    return df
+
+
+def read_excel_sheet(path: Path, sheet_name: int | str = 0, header: int = 0,
+                     cachedir: Path = None) -> DataFrame:
+    path = Path(path).resolve()
+
+    # NOTE: data sources may be loaded concurrently, so sheets from the same
+    # workbook are read one at a time and only parsed by the first caller
+    with _workbook_lock(path):
+        df = _read_excel_sheet(path, sheet_name, header, cachedir)
+
+    # NOTE: callers are free to modify the returned frame in place
+    return df.copy()
+
+
+def close_workbooks() -> None:
+    for workbook in _open_workbooks.values():
+        workbook.close()
+
+    _open_workbooks.clear()
+    _loaded_sheets.clear()
+    _file_digests.clear()
+    _workbook_locks.clear()
@@ -1,12 +1,25 @@
 import re
 import logging
+import multiprocessing
 import pandas as pd
+from pandas.api.types import union_categoricals
 
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Sequence
+from collections import defaultdict
+from typing import Any, Dict, Optional, Sequence, Tuple
 
 from hub_datatools.datasources import DataSource, datasource
+from hub_datatools.serialize import try_load_data
+
+EDMUS_FILENAME_PATTERN = (r'(?P<site>\w+)-(?P<section>\w+)-(?:\d+)-'
+                          r'(?P<timestamp>.+)-(?P<export_mode>\w+)\.txt')
+
+EDMUS_TIMESTAMP_FORMAT = '%y%m%d_%H%M%S'
+
+EDMUS_EXPORTS_ATTR = 'edmus_exports'
 
 EDMUS_DATES_V5_7 = [
     'onset_date',
@@ -82,12 +95,41 @@ EDMUS_INDEXES_V5_7 = {
     'Vaccine': 'vaccine_id',
 }
 
-EDMUS_INDEXES = {
-    '5.7': EDMUS_INDEXES_V5_7,
+EDMUS_CATEGORIES_V5_7 = [
+    'sex',
+    'gender',
+    'export_mode',
+    'vital_status',
+    'ms_course',
+    'disease_course',
+    'diagnosis',
+    'diagnostic_certainty',
+    'treatment_type',
+    'onset_type',
+    'outcome',
+]
+
+EDMUS_DTYPES_V5_7 = {
+    'edss': 'Float64',
+    'age_at_onset': 'Float64',
+    'age_at_diagnosis': 'Float64',
 }
 
-EDMUS_DATES = {
-    '5.7': EDMUS_DATES_V5_7,
+EDMUS_DROPPED_V5_7 = [
+    'created_by',
+    'last_modified_by',
+    'validated_by',
+]
+
+EDMUS_SCHEMAS = {
+    '5.7': {
+        'indexes': EDMUS_INDEXES_V5_7,
+        'dates': EDMUS_DATES_V5_7,
+        'date_format': '%d/%m/%Y',
+        'categories': EDMUS_CATEGORIES_V5_7,
+        'dtypes': EDMUS_DTYPES_V5_7,
+        'dropped': EDMUS_DROPPED_V5_7,
+    },
 }
 
 
@@ -96,40 +138,117 @@ def _normalize_string(s: str) -> str:
     return s.lower()
 
 
-def _transform_parse_dates(df: pd.DataFrame, datecols: Sequence[str]) -> pd.DataFrame:
-    cols = [col for col in df.columns if col in datecols]
-    df.loc[:, cols] = df.loc[:, cols].apply(lambda x: pd.to_datetime(x, format='%d/%m/%Y'))
+def _make_column_dtypes(names: Dict[str, str], schema: Dict[str, Any]) -> Dict[str, Any]:
+    dtypes = {}
+    for col, name in names.items():
+        if name in schema['dates']:
+            dtypes[col] = object
+        elif name in schema['categories']:
+            dtypes[col] = 'category'
+        elif name in schema['dtypes']:
+            dtypes[col] = schema['dtypes'][name]
+    return dtypes
 
 
-def _try_load_edmus_data_file(path: Path, indexes: Dict[str, str], datecols: Sequence[str] = None) -> pd.DataFrame:
-    pattern = r'(?P<site>\w+)-(?P<section>\w+)-(?:\d+)-(?:\d{6})_(?:\d{6})-(?P<export_mode>\w+)\.txt'
-    result = re.match(pattern, path.name)
-    if not result:
-        return None
+def _parse_edmus_timestamp(timestamp: str) -> datetime:
+    # NOTE: exports are ordered by their parsed timestamp, so any timestamp not in
+    # the expected format is rejected instead of being compared as a string
+    try:
+        return datetime.strptime(timestamp, EDMUS_TIMESTAMP_FORMAT)
+    except ValueError:
+        raise ValueError(f'EDMUS: Unsupported export timestamp "{timestamp}" '
+                         f'(expected format {EDMUS_TIMESTAMP_FORMAT})')
 
-    section = result.group('section')
-    logging.info(f'EDMUS: Loading "{section}" data file')
-    df = pd.read_csv(path, sep='\t', encoding='utf-16')
-    df.rename(columns=_normalize_string, inplace=True)
-    _transform_parse_dates(df, datecols)
 
-    index = indexes.get(section)
-    if index is not None:
-        df.set_index(index, inplace=True)
+def _find_edmus_exports(dirs: Sequence[Path]) -> Dict[Tuple[str, str], Tuple[str, Path]]:
+    exports = {}
+    for dir in dirs:
+        try:
+            paths = list(Path(dir).iterdir())
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f'EDMUS: Data directory "{dir}" does not exist')
+
+        for path in paths:
+            result = re.match(EDMUS_FILENAME_PATTERN, path.name)
+            if not result:
+                continue
+
+            key = (result.group('section'), result.group('site'))
+            timestamp = result.group('timestamp')
+            try:
+                parsed = _parse_edmus_timestamp(timestamp)
+            except ValueError as e:
+                raise ValueError(f'{e} in "{path.name}"')
+
+            if key not in exports or _parse_edmus_timestamp(exports[key][0]) < parsed:
+                exports[key] = (timestamp, path)
+
+    return exports
+
+
+def _load_edmus_data_file(path: Path, schema: Dict[str, Any]) -> pd.DataFrame:
+    # NOTE: only the header is read first, so that unused columns can be skipped and
+    # known columns parsed with their declared types, using their normalized names
+    header = pd.read_csv(path, sep='\t', encoding='utf-16', nrows=0).columns
+    names = {col: _normalize_string(col) for col in header
+             if _normalize_string(col) not in schema['dropped']}
+
+    df = pd.read_csv(path, sep='\t', encoding='utf-16', usecols=list(names.keys()),
+                     dtype=_make_column_dtypes(names, schema))
+    df.rename(columns=names, inplace=True)
+
+    for col in df.columns.intersection(schema['dates']):
+        df[col] = pd.to_datetime(df[col], format=schema['date_format'])
+
+    return df
 
-    return _normalize_string(section), df
+
+def _select_site_rows(df: pd.DataFrame, site: str) -> pd.DataFrame:
+    if 'site' in df.index.names:
+        return df.xs(site, level='site').reset_index()
+    return df[df.site == site].drop(columns='site').reset_index(drop=True)
+
+
+def _union_site_categories(frames: Sequence[pd.DataFrame]) -> Dict[str, pd.CategoricalDtype]:
+    columns = defaultdict(list)
+    for df in frames:
+        for col in df.select_dtypes('category').columns:
+            columns[col].append(df[col])
+    return {col: pd.CategoricalDtype(union_categoricals(values, ignore_order=True).categories)
+            for col, values in columns.items()}
+
+
+def _merge_edmus_sites(frames: Dict[str, pd.DataFrame], index: Optional[str]) -> pd.DataFrame:
+    # NOTE: categorical columns only keep their dtype when concatenated if their
+    # categories are the same for every site, so they are extended to the union
+    # of the categories of all sites first
+    sites = sorted(frames.keys())
+    dtypes = _union_site_categories(list(frames.values()))
+    df = pd.concat([frames[site].astype({col: dtype for col, dtype in dtypes.items()
+                                         if col in frames[site].columns})
+                    for site in sites], keys=sites, names=['site', None])
+    df = df.reset_index(level='site').reset_index(drop=True).astype(dtypes)
+    if index is not None:
+        df.set_index(['site', index], inplace=True)
+    return df
 
 
 @datasource('edmus')
 class EDMUS(DataSource):
 
+    incremental = True
+
     @ staticmethod
     def add_arguments(parser: ArgumentParser) -> None:
-        parser.add_argument('--edmus', metavar='EXPORT_FILE',
-                            help='EDMUS exported data directory')
+        parser.add_argument('--edmus', metavar='EXPORT_DIR', nargs='+',
+                            help='EDMUS exported data directories')
         parser.add_argument('--edmus-version', metavar='VERSION',
-                            choices=EDMUS_INDEXES.keys(),
+                            choices=EDMUS_SCHEMAS.keys(),
                             help='EDMUS version')
+        parser.add_argument('--edmus-jobs', metavar='N', type=int,
+                            help='number of EDMUS data files to load concurrently')
+        parser.add_argument('--edmus-reload', action='store_true',
+                            help='reload EDMUS data files already present in snapshot')
 
     @ staticmethod
     def is_active(args: Namespace) -> bool:
@@ -139,17 +258,70 @@ class EDMUS(DataSource):
         if args.edmus_version is None:
             raise ValueError('missing --edmus-version argument')
 
-        indexes = EDMUS_INDEXES.get(args.edmus_version)
-        coldates = EDMUS_DATES.get(args.edmus_version)
-        if not indexes or not coldates:
-            raise NotImplemented('EDMUS: Unsupported version given')
+        schema = EDMUS_SCHEMAS.get(args.edmus_version)
+        if not schema:
+            raise NotImplementedError('EDMUS: Unsupported version given')
 
-        try:
-            results = {}
-            for path in Path(args.edmus).iterdir():
-                section, data = _try_load_edmus_data_file(path, indexes, coldates)
-                results[f'edmus/{section}'] = data
-            return results
+        exports = _find_edmus_exports(args.edmus)
+        sections = {section for section, _ in exports.keys()}
 
-        except FileNotFoundError as e:
-            raise FileNotFoundError('EDMUS: Data directory does not exist')
+        # NOTE: snapshot tables record the export timestamp of each site they were
+        # built from, so that rows from exports which are not newer are reused
+        frames = defaultdict(dict)
+        timestamps = defaultdict(dict)
+        for section in sections:
+            if args.edmus_reload:
+                continue
+
+            previous = try_load_data(args.datadir, f'edmus/{_normalize_string(section)}')
+            if previous is None:
+                continue
+
+            for site, timestamp in previous.attrs.get(EDMUS_EXPORTS_ATTR, {}).items():
+                newest = exports.get((section, site))
+                if newest is None or _parse_edmus_timestamp(newest[0]) <= _parse_edmus_timestamp(timestamp):
+                    logging.info(f'EDMUS: Reusing "{section}" data from site {site}')
+                    frames[section][site] = _select_site_rows(previous, site)
+                    timestamps[section][site] = timestamp
+
+        pending = {path: (section, site, timestamp)
+                   for (section, site), (timestamp, path) in exports.items()
+                   if site not in timestamps[section]}
+
+        nerrors = 0
+        # NOTE: data sources are imported from worker threads, and forking a process
+        # with other threads running may deadlock it, so workers are spawned instead
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=args.edmus_jobs, mp_context=mp_context) as executor:
+            futures = {executor.submit(_load_edmus_data_file, path, schema): path
+                       for path in pending.keys()}
+
+            for future in as_completed(futures):
+                path = futures[future]
+                section, site, timestamp = pending[path]
+                try:
+                    frames[section][site] = future.result()
+                    timestamps[section][site] = timestamp
+                    logging.info(f'EDMUS: Loaded "{section}" data file from site {site}')
+                except Exception as e:
+                    logging.error(f'EDMUS: Could not load "{path.name}": {e}')
+                    nerrors += 1
+
+        if nerrors > 0:
+            raise RuntimeError(f'EDMUS: {nerrors} data files could not be loaded')
+
+        # NOTE: sections whose sites were all reused are already up to date in
+        # the snapshot, so they are not written again
+        changed = {section for section, _, _ in pending.values()}
+
+        results = {}
+        for section, sites in frames.items():
+            if section not in changed:
+                logging.info(f'EDMUS: "{section}" data is up to date')
+                continue
+
+            df = _merge_edmus_sites(sites, schema['indexes'].get(section))
+            df.attrs[EDMUS_EXPORTS_ATTR] = timestamps[section]
+            results[f'edmus/{_normalize_string(section)}'] = df
+
+        return results
@@ -1,10 +1,11 @@
-import pandas as pd
 from pandas import DataFrame
 
 import logging
 from argparse import ArgumentParser, Namespace
 
 from hub_datatools.datasources import DataSource, datasource
+from hub_datatools.datasources._hub import split_episodes_and_diagnoses
+from hub_datatools.datasources._workbook import read_excel_sheet
 
 
 PATIENT_ID_COLUMN = 'Pacient (NHC)'
@@ -43,31 +44,6 @@ FFILL_COLUMNS = [
 ]
 
 
-def _load_episodes_from_df(df: DataFrame) -> DataFrame:
-    logging.info('HUB_HOSP: Loading hospitalization episodes data')
-
-    df = df.copy()
-    df.drop_duplicates(subset=EPISODE_COLUMNS.keys(), inplace=True)
-    df[EPISODE_BEGIN_COLUMN] = pd.to_datetime(df[EPISODE_BEGIN_COLUMN])
-    df[EPISODE_END_COLUMN] = pd.to_datetime(df[EPISODE_END_COLUMN])
-    df.rename(columns=EPISODE_COLUMNS, inplace=True)
-    df.inicio_episodio = pd.to_datetime(df.inicio_episodio)
-    df.fin_episodio = pd.to_datetime(df.fin_episodio)
-    df.set_index('id_episodio', inplace=True)
-    df.dropna(how='all', inplace=True)
-    return df
-
-
-def _load_diagnoses_from_df(df: DataFrame) -> DataFrame:
-    logging.info('HUB_HOSP: Loading hospitalization diagnoses data')
-
-    df = df.copy()[DIAGNOSES_COLUMNS.keys()]
-    df.rename(columns=DIAGNOSES_COLUMNS, inplace=True)
-    df.set_index(['id_episodio', 'codigo_dx'], inplace=True)
-    df.dropna(how='all', inplace=True)
-    return df
-
-
 @datasource('hub_hosp')
 class HUBHosp(DataSource):
 
@@ -85,11 +61,14 @@ class HUBHosp(DataSource):
         return args.hub_hosp is not None
 
     def load_data(self, args: Namespace) -> DataFrame:
-        df = pd.read_excel(args.hub_hosp, sheet_name=args.hub_hosp_excel_tab,
-                           header=args.hub_hosp_column_row - 1)
-        df[FFILL_COLUMNS] = df[FFILL_COLUMNS].ffill()
+        df = read_excel_sheet(args.hub_hosp, sheet_name=args.hub_hosp_excel_tab,
+                              header=args.hub_hosp_column_row - 1, cachedir=args.cachedir)
+        logging.info('HUB_HOSP: Loading hospitalization episodes and diagnoses data')
+        episodes, diagnoses = split_episodes_and_diagnoses(
+            df, EPISODE_ID_COLUMN, EPISODE_COLUMNS, DIAGNOSES_COLUMNS, FFILL_COLUMNS,
+            date_columns=[EPISODE_BEGIN_COLUMN, EPISODE_END_COLUMN], dropna_how='all')
 
         return {
-            'hub_hosp/episodes': _load_episodes_from_df(df),
-            'hub_hosp/diagnoses': _load_diagnoses_from_df(df),
+            'hub_hosp/episodes': episodes,
+            'hub_hosp/diagnoses': diagnoses,
         }
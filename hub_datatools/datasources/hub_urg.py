@@ -1,10 +1,11 @@
-import pandas as pd
 from pandas import DataFrame
 
 import logging
 from argparse import ArgumentParser, Namespace
 
 from hub_datatools.datasources import DataSource, datasource
+from hub_datatools.datasources._hub import split_episodes_and_diagnoses
+from hub_datatools.datasources._workbook import read_excel_sheet
 
 
 PATIENT_ID_COLUMN = 'Pacient (NHC)'
@@ -45,29 +46,6 @@ FFILL_COLUMNS = [
 ]
 
 
-def _load_episodes_from_df(df: DataFrame) -> DataFrame:
-    logging.info('HUB_URG: Loading ER episode data')
-
-    df = df.copy()
-    df.drop_duplicates(subset=EPISODE_COLUMNS.keys(), inplace=True)
-    df[EPISODE_BEGIN_COLUMN] = pd.to_datetime(df[EPISODE_BEGIN_COLUMN])
-    df[EPISODE_END_COLUMN] = pd.to_datetime(df[EPISODE_END_COLUMN])
-    df.rename(columns=EPISODE_COLUMNS, inplace=True)
-    df.set_index('id_episodio', inplace=True)
-    df.dropna(axis='index', inplace=True)
-    return df
-
-
-def _load_diagnoses_from_df(df: DataFrame) -> DataFrame:
-    logging.info('HUB_URG: Loading ER diagnoses data')
-
-    df = df.copy()[DIAGNOSES_COLUMNS.keys()]
-    df.rename(columns=DIAGNOSES_COLUMNS, inplace=True)
-    df.set_index(['id_episodio', 'codigo_dx'], inplace=True)
-    df.dropna(axis='index', inplace=True)
-    return df
-
-
 @datasource('hub_urg')
 class HUBUrg(DataSource):
 
@@ -85,11 +63,14 @@ class HUBUrg(DataSource):
         return args.hub_urg is not None
 
     def load_data(self, args: Namespace) -> DataFrame:
-        df = pd.read_excel(args.hub_urg, sheet_name=args.hub_urg_excel_tab,
-                           header=args.hub_urg_column_row - 1)
-        df[FFILL_COLUMNS] = df[FFILL_COLUMNS].ffill()
+        df = read_excel_sheet(args.hub_urg, sheet_name=args.hub_urg_excel_tab,
+                              header=args.hub_urg_column_row - 1, cachedir=args.cachedir)
+        logging.info('HUB_URG: Loading ER episodes and diagnoses data')
+        episodes, diagnoses = split_episodes_and_diagnoses(
+            df, EPISODE_ID_COLUMN, EPISODE_COLUMNS, DIAGNOSES_COLUMNS, FFILL_COLUMNS,
+            date_columns=[EPISODE_BEGIN_COLUMN, EPISODE_END_COLUMN], dropna_how='any')
 
         return {
-            'hub_urg/episodes': _load_episodes_from_df(df),
-            'hub_urg/diagnoses': _load_diagnoses_from_df(df),
+            'hub_urg/episodes': episodes,
+            'hub_urg/diagnoses': diagnoses,
         }
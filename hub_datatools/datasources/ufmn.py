@@ -2,7 +2,7 @@ import logging
 import sqlite3
 from argparse import ArgumentParser, Namespace
 from sqlite3 import Connection
-from typing import Dict
+from typing import Iterator, Tuple
 
 import pandas as pd
 from pandas import DataFrame
@@ -105,6 +105,29 @@ WEAKNESS_PATTERN_CATEGORIES = {
 GENE_STATUS_NORMAL_VALUE = 'Normal'
 GENE_STATUS_ALTERED_VALUE = 'Alterado'
 
+GENE_STATUS_RULES = {
+    'estado_atxn2': ('ATXN2', {
+        'NORMAL': GENE_STATUS_NORMAL_VALUE,
+        'INTERMEDIO': GENE_STATUS_ALTERED_VALUE,
+    }),
+    'estado_ar': ('KENNEDY', {
+        'NORMAL': GENE_STATUS_NORMAL_VALUE,
+        'POSITIVO': GENE_STATUS_ALTERED_VALUE,
+    }),
+    'estado_tardbp': (r'\b(?:TARDBP|TDP-?43)\b', {
+        'NORMAL': GENE_STATUS_NORMAL_VALUE,
+        'POSITIVO': GENE_STATUS_ALTERED_VALUE,
+    }),
+    'estado_fus': (r'\bFUS\b', {
+        'NORMAL': GENE_STATUS_NORMAL_VALUE,
+        'POSITIVO': GENE_STATUS_ALTERED_VALUE,
+    }),
+    'estado_tbk1': (r'\bTBK1\b', {
+        'NORMAL': GENE_STATUS_NORMAL_VALUE,
+        'POSITIVO': GENE_STATUS_ALTERED_VALUE,
+    }),
+}
+
 PATIENT_RENAME_COLUMNS = {
     'fecha_diagnostico_ELA': 'fecha_dx',
     'fecha_inicio_clinica': 'inicio_clinica',
@@ -246,38 +269,30 @@ def _add_patient_genetic_data(df: DataFrame) -> None:
     apply_transform_pipeline(df, 'resultado_estudio_c9', OPT_ENUM_PIPELINE, inplace=True)
     apply_transform_pipeline(df, 'resultado_estudio_sod1', OPT_ENUM_PIPELINE, inplace=True)
 
-    df['estado_atxn2'] = None
-    df.loc[df[OTHER_GENES_COLUMN].str.contains(
-        'ATXN2[^@]+NORMAL', case=False), 'estado_atxn2'] = GENE_STATUS_NORMAL_VALUE
-    df.loc[df[OTHER_GENES_COLUMN].str.contains(
-        'ATXN2[^@]+INTERMEDIO', case=False), 'estado_atxn2'] = GENE_STATUS_ALTERED_VALUE
-    df['estado_atxn2'] = df['estado_atxn2'].astype('category')
-
-    df['estado_ar'] = None
-    df.loc[df[OTHER_GENES_COLUMN].str.contains(
-        'KENNEDY[^@]+NORMAL', case=False), 'estado_ar'] = GENE_STATUS_NORMAL_VALUE
-    df.loc[df[OTHER_GENES_COLUMN].str.contains(
-        'KENNEDY[^@]+POSITIVO', case=False), 'estado_ar'] = GENE_STATUS_ALTERED_VALUE
-    df['estado_ar'] = df['estado_ar'].astype('category')
+    status = extract_list_field_status(df[OTHER_GENES_COLUMN], GENE_STATUS_RULES)
+    for name in status.columns:
+        df[name] = status[name]
 
 
 def _add_patient_involvement_data(df: DataFrame) -> None:
-    data = df.distribucion_al_inicio.str.split('@', n=3, expand=True)
-
-    # NOTE: for each row, for each list item, try to map into allowed categories
-    # fillna method MUST be 'ffill' as predominance is a valid involvement category
-    # and it will overwrite involvement otherwise
-    involvement = data.apply(lambda xs: xs.map(MN_INVOLVEMENT_CATEGORIES)).ffill(axis=1).iloc[:, 2]
-    predominance = data.apply(lambda xs: xs.map(
-        MN_PREDOMINANCE_CATEGORIES)).ffill(axis=1).iloc[:, 2]
+    # NOTE: for each row, map list items into allowed categories and keep the last
+    # match among the first three items, as predominance is a valid involvement
+    # category and it would overwrite involvement otherwise
+    data = decode_list_field(df.distribucion_al_inicio, {
+        'involvement': MN_INVOLVEMENT_CATEGORIES,
+        'predominance': MN_PREDOMINANCE_CATEGORIES,
+        'weakness': WEAKNESS_PATTERN_CATEGORIES,
+    }, maxitems=3)
+
+    involvement = data.involvement
+    predominance = data.predominance
 
     df['afectacion_mn'] = involvement
     df.loc[(involvement == 'MNS+MNI') & (predominance == 'Ninguno'), 'afectacion_mn'] = 'MNS+MNI'
     df.loc[(involvement == 'MNS+MNI') & (predominance == 'MNS'), 'afectacion_mn'] = 'MNS>MNI'
     df.loc[(involvement == 'MNS+MNI') & (predominance == 'MNI'), 'afectacion_mn'] = 'MNI>MNS'
 
-    df['patron_debilidad'] = data.apply(lambda xs: xs.map(
-        WEAKNESS_PATTERN_CATEGORIES)).ffill(axis=1).iloc[:, 2]
+    df['patron_debilidad'] = data.weakness
 
 
 def _clean_clinical_data(df: DataFrame) -> None:
@@ -496,11 +511,9 @@ class UFMN(DataSource):
     def is_active(args: Namespace) -> bool:
         return args.ufmn is not None
 
-    def load_data(self, args: Namespace) -> Dict[str, DataFrame]:
+    def iter_data(self, args: Namespace) -> Iterator[Tuple[str, DataFrame]]:
         with sqlite3.connect(f'file:{args.ufmn}?mode=ro', uri=True) as con:
-            return {
-                'ufmn/patients': _load_patients_sql(con),
-                'ufmn/alsfrs': _load_alsfrs_data_sql(con),
-                'ufmn/resp': _load_resp_data_sql(con),
-                'ufmn/nutr': _load_nutr_data_sql(con),
-            }
+            yield 'ufmn/patients', _load_patients_sql(con)
+            yield 'ufmn/alsfrs', _load_alsfrs_data_sql(con)
+            yield 'ufmn/resp', _load_resp_data_sql(con)
+            yield 'ufmn/nutr', _load_nutr_data_sql(con)
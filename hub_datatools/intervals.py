@@ -0,0 +1,151 @@
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+from pandas.api.types import is_integer_dtype
+
+from hub_datatools.lookup import load_lookup, lookup_values
+from hub_datatools.serialize import load_data, save_data, try_load_data
+
+INTERVALS_PREFIX = 'intervals'
+
+# NOTE: episode tables indexed by patient, given their start and end columns and
+# the identifier used to link them to patients
+INTERVAL_TABLES = {
+    'hub_urg/episodes': {'start': 'inicio_episodio', 'end': 'fin_episodio', 'lookup': 'nhc'},
+    'hub_hosp/episodes': {'start': 'inicio_episodio', 'end': 'fin_episodio', 'lookup': 'nhc'},
+}
+
+PATIENT_ID_COLUMN = 'id_paciente'
+
+_OPEN_END = np.iinfo('int64').max
+
+
+def _intervals_name(name: str) -> str:
+    return f'{INTERVALS_PREFIX}/{name}'
+
+
+def _to_times(data: Any) -> np.ndarray:
+    times = pd.to_datetime(Series(data)).astype('datetime64[ns]')
+    return times.to_numpy().view('int64')
+
+
+def _to_keys(data: Any) -> np.ndarray:
+    data = Series(data)
+    return data.to_numpy('int64') if is_integer_dtype(data.dtype) else data.to_numpy(object)
+
+
+def _build_intervals(datadir: Path, df: DataFrame, spec: Dict[str, str]) -> DataFrame:
+    lookup = load_lookup(datadir, spec['lookup'])
+    intervals = DataFrame({
+        PATIENT_ID_COLUMN: lookup_values(lookup, df[spec['lookup']], validate='many_to_one').array,
+        'inicio': pd.to_datetime(df[spec['start']]).to_numpy(),
+        'fin': pd.to_datetime(df[spec['end']]).to_numpy(),
+    }, index=df.index)
+
+    # NOTE: episodes without end are kept open, and those ending before they
+    # start are reduced to their start
+    intervals = intervals[intervals[PATIENT_ID_COLUMN].notna() & intervals.inicio.notna()]
+    intervals = intervals.astype({PATIENT_ID_COLUMN: lookup.dtype})
+    intervals['fin'] = intervals.fin.where(intervals.fin.isna() | (intervals.fin >= intervals.inicio),
+                                           intervals.inicio)
+    return intervals.reset_index().sort_values([PATIENT_ID_COLUMN, 'inicio'], kind='stable',
+                                               ignore_index=True)
+
+
+def build_episode_intervals(datadir: Path) -> None:
+    for name, spec in INTERVAL_TABLES.items():
+        df = try_load_data(datadir, name)
+        if df is not None:
+            save_data(datadir, {_intervals_name(name): _build_intervals(datadir, df, spec)}, replace=True)
+
+
+class EpisodeIntervals:
+
+    def __init__(self, intervals: DataFrame):
+        self._ids = intervals.drop(columns=[PATIENT_ID_COLUMN, 'inicio', 'fin']).iloc[:, 0]
+
+        self._patients, codes = np.unique(_to_keys(intervals[PATIENT_ID_COLUMN]), return_inverse=True)
+        self._codes = codes
+        self._starts = _to_times(intervals.inicio)
+        self._ends = np.where(intervals.fin.isna(), _OPEN_END, _to_times(intervals.fin))
+
+        # NOTE: intervals are sorted by patient and start, and keyed by patient code
+        # and time rank, so that one binary search finds the episodes of a patient
+        # starting up to some time; the running maximum end of the episodes of each
+        # patient bounds from below the episodes that can still reach some time
+        self._start_times = np.unique(self._starts)
+        self._start_keys = codes * (len(self._start_times) + 1) + np.searchsorted(self._start_times, self._starts)
+
+        end_times = np.unique(self._ends)
+        end_ranks = codes * (len(end_times) + 1) + np.searchsorted(end_times, self._ends)
+        self._maxend_keys = np.maximum.accumulate(end_ranks) if len(end_ranks) else end_ranks
+        self._end_times = end_times
+
+    @staticmethod
+    def load(datadir: Path, name: str) -> 'EpisodeIntervals':
+        return EpisodeIntervals(load_data(datadir, _intervals_name(name)))
+
+    def _patient_codes(self, patients: Any) -> np.ndarray:
+        patients = _to_keys(patients)
+        codes = np.searchsorted(self._patients, patients)
+        found = codes < len(self._patients)
+        found[found] = self._patients[codes[found]] == patients[found]
+        return np.where(found, codes, -1)
+
+    def _candidates(self, patients: Any, reach: np.ndarray, until: np.ndarray):
+        codes = self._patient_codes(patients)
+
+        # first episode whose running maximum end reaches the given time
+        lo = np.searchsorted(self._maxend_keys, codes * (len(self._end_times) + 1)
+                             + np.searchsorted(self._end_times, reach, side='left'), side='left')
+        # past the last episode starting up to the given time
+        hi = np.searchsorted(self._start_keys, codes * (len(self._start_times) + 1)
+                             + np.searchsorted(self._start_times, until, side='right'), side='left')
+        hi = np.where(codes < 0, lo, np.maximum(hi, lo))
+
+        counts = hi - lo
+        queries = np.repeat(np.arange(len(codes)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return queries, np.repeat(lo, counts) + offsets
+
+    def _result(self, index: Any, queries: np.ndarray, positions: np.ndarray) -> DataFrame:
+        return DataFrame({
+            'query': np.asarray(index)[queries],
+            self._ids.name: self._ids.to_numpy()[positions],
+        })
+
+    def stab(self, patients: Any, times: Any, index: Any = None) -> DataFrame:
+        times = _to_times(times)
+        queries, positions = self._candidates(patients, times, times)
+        matched = self._ends[positions] >= times[queries]
+        index = np.arange(len(times)) if index is None else index
+        return self._result(index, queries[matched], positions[matched])
+
+    def overlaps(self, patients: Any, starts: Any, ends: Any, index: Any = None) -> DataFrame:
+        starts, ends = _to_times(starts), _to_times(ends)
+        queries, positions = self._candidates(patients, starts, ends)
+        matched = self._ends[positions] >= starts[queries]
+        index = np.arange(len(starts)) if index is None else index
+        return self._result(index, queries[matched], positions[matched])
+
+    def contains(self, patients: Any, starts: Any, ends: Any, index: Any = None) -> DataFrame:
+        starts, ends = _to_times(starts), _to_times(ends)
+        queries, positions = self._candidates(patients, ends, starts)
+        matched = self._ends[positions] >= ends[queries]
+        index = np.arange(len(starts)) if index is None else index
+        return self._result(index, queries[matched], positions[matched])
+
+    def patients_between(self, start: Any, end: Any) -> np.ndarray:
+        start, end = _to_times([start, end])
+        matched = (self._starts <= end) & (self._ends >= start)
+        return np.unique(self._patients[self._codes[matched]])
+
+    def within(self, patients: Any, starts: Any, ends: Any, index: Any = None) -> DataFrame:
+        starts, ends = _to_times(starts), _to_times(ends)
+        queries, positions = self._candidates(patients, starts, ends)
+        matched = (self._starts[positions] >= starts[queries]) & (self._ends[positions] <= ends[queries])
+        index = np.arange(len(starts)) if index is None else index
+        return self._result(index, queries[matched], positions[matched])
@@ -0,0 +1,136 @@
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional, Sequence, Set
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Index, Series
+
+from hub_datatools.serialize import save_data, try_load_data
+
+SURROGATE_KEYS = ['id_paciente', 'id_visita', 'id_episodio']
+
+KEYS_PREFIX = 'keys'
+
+
+def _mapping_name(key: str) -> str:
+    return f'{KEYS_PREFIX}/{key}'
+
+
+def _load_mapping(datadir: Path, key: str) -> Optional[Series]:
+    return try_load_data(datadir, _mapping_name(key))
+
+
+# NOTE: surrogate keys are assigned in order of appearance and never reused, so
+# that keys from previous imports remain valid as new entities are found
+class KeyRegistry:
+
+    def __init__(self, datadir: Path):
+        self._datadir = datadir
+        self._lock = Lock()
+        self._mappings: Dict[str, Index] = {}
+        self._changed: Set[str] = set()
+
+    def _get_mapping(self, key: str) -> Index:
+        mapping = self._mappings.get(key)
+        if mapping is None:
+            saved = _load_mapping(self._datadir, key)
+            mapping = Index(saved.values if saved is not None else [], dtype=object)
+            self._mappings[key] = mapping
+        return mapping
+
+    def encode(self, key: str, values: Series) -> Series:
+        values = Series(values).astype(object)
+        na = values.isna().to_numpy()
+        with self._lock:
+            mapping = self._get_mapping(key)
+            codes = mapping.get_indexer(values)
+            missing = (codes == -1) & ~na
+            if missing.any():
+                mapping = mapping.append(Index(values[missing].unique(), dtype=object))
+                self._mappings[key] = mapping
+                self._changed.add(key)
+                codes = mapping.get_indexer(values)
+
+        if na.any():
+            return Series(pd.arrays.IntegerArray(codes.astype('int64'), na), index=values.index)
+        return Series(codes.astype('int64'), index=values.index)
+
+    def find(self, key: str, values: Sequence[Any]) -> Optional[np.ndarray]:
+        # NOTE: unlike encoding, finding keys never assigns new ones, so unknown
+        # values are given -1, and snapshots without surrogate keys give None
+        with self._lock:
+            mapping = self._mappings.get(key)
+            if mapping is None:
+                saved = _load_mapping(self._datadir, key)
+                if saved is None:
+                    return None
+                mapping = self._mappings[key] = Index(saved.values, dtype=object)
+            return mapping.get_indexer(Index(values, dtype=object))
+
+    def encode_frame(self, df: DataFrame) -> DataFrame:
+        levels = [name for name in df.index.names if name in SURROGATE_KEYS]
+        columns = [name for name in df.columns if name in SURROGATE_KEYS]
+        if not levels and not columns:
+            return df
+
+        index_names = df.index.names
+        if levels:
+            df = df.reset_index()
+            columns += levels
+        else:
+            df = df.copy()
+
+        for col in columns:
+            df[col] = self.encode(col, df[col])
+
+        if levels:
+            df = df.set_index(index_names)
+        return df
+
+    def save(self) -> None:
+        # NOTE: mappings are saved while locked, so that concurrent saves never
+        # replace a mapping with an older one missing keys already in use
+        with self._lock:
+            data = {_mapping_name(key): Series(self._mappings[key], name=key).rename_axis('key')
+                    for key in self._changed}
+            save_data(self._datadir, data, replace=True)
+            self._changed.clear()
+
+
+def decode_keys(datadir: Path, df: Any, names: Optional[Dict[str, str]] = None) -> Any:
+    if names is None:
+        names = {key: key for key in SURROGATE_KEYS}
+
+    # NOTE: series are decoded by their name and index levels, and any other
+    # data is returned as it is
+    if isinstance(df, Series):
+        name = df.name if df.name is not None else '_values'
+        decoded = decode_keys(datadir, df.to_frame(name), names)
+        return decoded[name].rename(df.name)
+    if not isinstance(df, DataFrame):
+        return df
+
+    levels = [name for name in df.index.names if name in names]
+    columns = [name for name in df.columns if name in names]
+    if not levels and not columns:
+        return df
+
+    index_names = df.index.names
+    if levels:
+        df = df.reset_index()
+        columns += levels
+    else:
+        df = df.copy()
+
+    for col in columns:
+        # NOTE: tables from snapshots without surrogate keys are left as they are
+        if not pd.api.types.is_integer_dtype(df[col]):
+            continue
+        mapping = _load_mapping(datadir, names[col])
+        if mapping is not None:
+            df[col] = df[col].map(mapping)
+
+    if levels:
+        df = df.set_index(index_names)
+    return df
@@ -0,0 +1,70 @@
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from pandas import DataFrame, Series
+from pandas.api.types import is_integer_dtype
+
+from hub_datatools.serialize import load_data, try_load_data
+
+# NOTE: snapshot tables whose index is looked up by the given columns, e.g. to
+# link episodes from other data sources to patients by their NHC or CIP
+LOOKUP_COLUMNS = {
+    'ufmn/patients': ['nhc', 'cip'],
+}
+
+LOOKUP_PREFIX = 'lookup'
+
+LOOKUP_VALIDATIONS = ['one_to_one', 'many_to_one', None]
+
+
+def _lookup_name(column: str) -> str:
+    return f'{LOOKUP_PREFIX}/{column}'
+
+
+def build_lookups(name: str, data: DataFrame) -> Iterator[Tuple[str, Series]]:
+    for column in LOOKUP_COLUMNS.get(name, []):
+        if column not in data.columns:
+            continue
+        values = data[column]
+        mask = values.notna().to_numpy()
+        lookup = Series(data.index[mask], index=values[mask].to_numpy(), name=data.index.name)
+        yield _lookup_name(column), lookup.rename_axis(column)
+
+
+def load_lookup(datadir: Path, column: str) -> Series:
+    lookup = try_load_data(datadir, _lookup_name(column))
+    if lookup is not None:
+        return lookup
+
+    # NOTE: snapshots imported before lookups were persisted build them from
+    # the indexed tables instead
+    for name, columns in LOOKUP_COLUMNS.items():
+        if column in columns:
+            lookups = dict(build_lookups(name, load_data(datadir, name)))
+            return lookups[_lookup_name(column)]
+
+    raise ValueError(f'No lookup defined for column "{column}"')
+
+
+def lookup_values(lookup: Series, values: Series, validate: Optional[str] = 'many_to_one') -> Series:
+    if validate not in LOOKUP_VALIDATIONS:
+        raise ValueError(f'Invalid lookup validation: {validate}')
+
+    if validate is not None and not lookup.index.is_unique:
+        duplicated = lookup.index[lookup.index.duplicated()].unique()
+        raise ValueError(f'Lookup keys are not unique: {", ".join(map(str, duplicated[:5]))}')
+
+    if validate is None:
+        lookup = lookup[~lookup.index.duplicated()]
+
+    positions = lookup.index.get_indexer(values)
+    found = positions != -1
+    if validate == 'one_to_one':
+        if values[found].duplicated().any():
+            raise ValueError('Looked up values are not unique')
+
+    # NOTE: values not found are returned as missing, keeping integer keys
+    array = lookup.array
+    if is_integer_dtype(array.dtype) and not found.all():
+        array = array.astype('Int64')
+    return Series(array.take(positions, allow_fill=True), index=values.index, name=lookup.name)
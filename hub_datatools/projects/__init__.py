@@ -1,17 +1,172 @@
-from abc import ABC, abstractmethod
+from abc import ABC
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from importlib import import_module
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
 
-from pandas import DataFrame
+from hub_datatools.serialize import load_data
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
+
+STEP_ATTR = '_project_step'
+SHEET_ATTR = '_project_sheet'
+
+
+def step(name: str, inputs: Sequence[str] = ()):
+    def step_decorator_helper(fn):
+        setattr(fn, STEP_ATTR, (name, list(inputs)))
+        return fn
+
+    return step_decorator_helper
+
+
+def sheet(name: str, inputs: Sequence[str] = ()):
+    def sheet_decorator_helper(fn):
+        setattr(fn, SHEET_ATTR, (name, list(inputs)))
+        return fn
+
+    return sheet_decorator_helper
+
+
+# NOTE: projects declare the snapshot tables they require and the steps and
+# sheets built from them, each one naming its inputs, which makes a DAG that
+# is only evaluated for the nodes required by the requested outputs
 class Project(ABC):
 
-    @abstractmethod
-    def export_data(self) -> DataFrame | Dict[str, DataFrame]:
-        pass
+    tables: List[str] = []
+
+    # NOTE: sheet columns or index levels holding surrogate keys, which are
+    # translated back to the original identifiers when exported
+    keys: Dict[str, str] = {}
+
+    def __init__(self, datadir: Path):
+        self._datadir = datadir
+
+    @classmethod
+    def _get_graph(cls) -> Dict[str, Tuple[Optional[str], List[str]]]:
+        graph = {name: (None, []) for name in cls.tables}
+        for klass in reversed(cls.__mro__):
+            for attr, value in vars(klass).items():
+                for marker in (STEP_ATTR, SHEET_ATTR):
+                    spec = getattr(value, marker, None)
+                    if spec is not None:
+                        name, inputs = spec
+                        graph[name] = (attr, inputs)
+
+        for name, (_, inputs) in graph.items():
+            unknown = [input for input in inputs if input not in graph]
+            if unknown:
+                raise ValueError(f'Unknown inputs for project step "{name}": {", ".join(unknown)}')
+
+        # NOTE: steps are sorted topologically, so that a cycle is found before
+        # running any of them instead of leaving steps waiting on each other
+        pending = {name: set(inputs) for name, (_, inputs) in graph.items()}
+        while pending:
+            ready = [name for name, inputs in pending.items() if not inputs]
+            if not ready:
+                raise ValueError(f'Project steps with cyclic inputs: {", ".join(sorted(pending))}')
+            for name in ready:
+                del pending[name]
+            for inputs in pending.values():
+                inputs.difference_update(ready)
+
+        return graph
+
+    @classmethod
+    def get_sheet_names(cls) -> List[str]:
+        names = []
+        for klass in reversed(cls.__mro__):
+            for value in vars(klass).values():
+                spec = getattr(value, SHEET_ATTR, None)
+                if spec is not None and spec[0] not in names:
+                    names.append(spec[0])
+        return names
+
+    def _run_step(self, name: str, attr: Optional[str], args: List[Any]) -> Any:
+        if attr is None:
+            return load_data(self._datadir, name)
+        return getattr(self, attr)(*args)
+
+    def compute(self, names: Sequence[str], jobs: Optional[int] = None) -> Dict[str, Any]:
+        graph = self._get_graph()
+        unknown = [name for name in names if name not in graph]
+        if unknown:
+            raise ValueError(f'Unknown project steps: {", ".join(unknown)}')
+
+        required = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in required:
+                required.add(name)
+                stack.extend(graph[name][1])
+
+        consumers = {name: 0 for name in required}
+        for name in required:
+            for input in set(graph[name][1]):
+                consumers[input] += 1
+
+        # NOTE: independent tables and steps run concurrently as soon as their
+        # inputs are ready, and intermediate results are released once every
+        # step depending on them is done
+        pending = {name: set(graph[name][1]) for name in required}
+        results = {}
+        outputs = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            while pending or futures:
+                for name in [name for name, inputs in pending.items() if not inputs]:
+                    del pending[name]
+                    attr, inputs = graph[name]
+                    args = [results[input] for input in inputs]
+                    futures[executor.submit(self._run_step, name, attr, args)] = name
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    result = future.result()
+                    if name in names:
+                        outputs[name] = result
+                    if consumers[name] > 0:
+                        results[name] = result
+                    del result
+
+                    for input in set(graph[name][1]):
+                        consumers[input] -= 1
+                        if consumers[input] == 0:
+                            del results[input]
+
+                    for inputs in pending.values():
+                        inputs.discard(name)
+
+        return {name: outputs[name] for name in names}
+
+    def export_data(self, sheets: Optional[Sequence[str]] = None,
+                    jobs: Optional[int] = None) -> 'DataFrame | Dict[str, DataFrame]':
+        available = self.get_sheet_names()
+        if sheets is None:
+            sheets = available
+
+        unknown = [name for name in sheets if name not in available]
+        if unknown:
+            raise ValueError(f'Unknown project sheets: {", ".join(unknown)}')
+
+        data = self.compute(sheets, jobs=jobs)
+        if not self.keys:
+            return data
+
+        from hub_datatools.keys import decode_keys
+        return {name: decode_keys(self._datadir, df, self.keys) for name, df in data.items()}
+
 
+# NOTE: project modules are only imported once they are selected, so that
+# CLI startup does not pay for importing every project and its dependencies
+PROJECT_MODULES = {
+    'als-geo': 'hub_datatools.projects.als_geo',
+    'precision-als': 'hub_datatools.projects.precision_als',
+}
 
 _registered_projects: Dict[str, type[Project]] = dict()
 
@@ -25,10 +180,14 @@ def project(name: str):
 
 
 def get_project_names() -> List[str]:
-    return _registered_projects.keys()
+    names = list(PROJECT_MODULES.keys())
+    names += [name for name in _registered_projects.keys() if name not in names]
+    return names
 
 
 def get_project_class(name: str) -> Optional[type[Project]]:
+    if name not in _registered_projects and name in PROJECT_MODULES:
+        import_module(PROJECT_MODULES[name])
     return _registered_projects.get(name)
 
 
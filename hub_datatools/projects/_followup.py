@@ -1,11 +1,20 @@
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
-from hub_datatools.serialize import load_data
+from hub_datatools.serialize import load_data, load_materialized_data
 
 
+FOLLOWUP_INPUTS = ['ufmn/alsfrs', 'ufmn/nutr', 'ufmn/resp']
+
+# NOTE: must be increased on any change to how follow-up data is built, here or
+# in the helpers it depends on, so that materialized follow-up data is rebuilt
+FOLLOWUP_VERSION = 1
+
+VISIT_KEY_COLUMNS = ['id_paciente', 'fecha_visita']
+
 ALSFRS_TOTAL_COLUMNS = [
     'lenguaje',
     'salivacion',
@@ -45,85 +54,200 @@ ALSFRS_RESPIRATORY_COLUMNS = [
     'insuf_resp',
 ]
 
-
-def _calculate_kings_from_alsfrs(df: pd.DataFrame) -> pd.Series:
-    result = pd.DataFrame([], index=df.index)
-    result['bulbar'] = (df[['lenguaje', 'salivacion', 'deglucion']] < 4).any(axis=1).astype('Int64')
-    result['upper'] = (df[['escritura', 'cortar_sin_peg']] < 4).any(axis=1).astype('Int64')
-    result['lower'] = (df.caminar < 4).astype('Int64')
-    result['regions'] = result.bulbar + result.upper + result.lower
-    result['nutr_failure'] = df.indicacion_peg
-    result['resp_failure'] = (df.disnea == 0) | (df.insuf_resp < 4)
-
-    result['stage'] = None
-    result.loc[result.regions.notna(), 'stage'] = result.regions.apply(str)
-    result.loc[result.nutr_failure == True, 'stage'] = '4A'
-    result.loc[result.resp_failure == True, 'stage'] = '4B'
-    return result.stage
-
-
-def _calculate_mitos_from_alsfrs(df: pd.DataFrame) -> pd.Series:
-    walking_selfcare = (df.caminar <= 1) | (df.vestido <= 1)
-    swallowing = df.deglucion <= 1
-    communicating = (df.lenguaje <= 1) | (df.escritura <= 1)
-    breathing = (df.disnea <= 1) | (df.insuf_resp <= 2)
-    domains = walking_selfcare.astype('Int64')
-    domains += swallowing.astype('Int64')
-    domains += communicating.astype('Int64')
-    domains += breathing.astype('Int64')
-    return domains
+ALSFRS_SUBSCORES = {
+    'alsfrs_bulbar_c': ALSFRS_BULBAR_COLUMNS,
+    'alsfrs_fine_motor_c': ALSFRS_FINE_MOTOR_COLUMNS,
+    'alsfrs_gross_motor_c': ALSFRS_GROSS_MOTOR_COLUMNS,
+    'alsfrs_respiratory_c': ALSFRS_RESPIRATORY_COLUMNS,
+    'alsfrs_total_c': ALSFRS_TOTAL_COLUMNS,
+}
+
+# NOTE: staging systems count the domains that are involved, where each domain is
+# involved if any of its (item, operator, value) conditions holds; when `skipna` is
+# set unknown items are ignored, otherwise a domain is unknown unless involved by
+# some known item. Stages given in `overrides` take precedence in the given order.
+KINGS_STAGING = {
+    'domains': {
+        'bulbar': (True, [('lenguaje', '<', 4), ('salivacion', '<', 4), ('deglucion', '<', 4)]),
+        'upper': (True, [('escritura', '<', 4), ('cortar_sin_peg', '<', 4)]),
+        'lower': (False, [('caminar', '<', 4)]),
+    },
+    'overrides': {
+        '4A': [('indicacion_peg', '==', True)],
+        '4B': [('disnea', '==', 0), ('insuf_resp', '<', 4)],
+    },
+    'categories': ['0', '1', '2', '3', '4A', '4B'],
+}
+
+MITOS_STAGING = {
+    'domains': {
+        'walking_selfcare': (False, [('caminar', '<=', 1), ('vestido', '<=', 1)]),
+        'swallowing': (False, [('deglucion', '<=', 1)]),
+        'communicating': (False, [('lenguaje', '<=', 1), ('escritura', '<=', 1)]),
+        'breathing': (False, [('disnea', '<=', 1), ('insuf_resp', '<=', 2)]),
+    },
+}
+
+STAGING_SYSTEMS = {
+    'kings_c': KINGS_STAGING,
+    'mitos_c': MITOS_STAGING,
+}
+
+_STAGING_OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+}
+
+
+class ScoreArrays:
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __getitem__(self, col: str) -> Tuple[np.ndarray, np.ndarray]:
+        array = self._arrays.get(col)
+        if array is None:
+            values = self._df[col].to_numpy(dtype='float64', na_value=np.nan)
+            array = self._arrays[col] = (values, np.isnan(values))
+        return array
+
+    def __setitem__(self, col: str, array: Tuple[np.ndarray, np.ndarray]) -> None:
+        self._arrays[col] = array
+
+
+def _to_int_series(values: np.ndarray, na: np.ndarray, index: pd.Index) -> pd.Series:
+    return pd.Series(pd.arrays.IntegerArray(values.astype('int64'), na), index=index)
+
+
+def _resolve_cutting_item(arrays: ScoreArrays) -> Tuple[np.ndarray, np.ndarray]:
+    peg, peg_na = arrays['portador_peg']
+    peg_values, peg_values_na = arrays['cortar_con_peg']
+    nopeg_values, nopeg_values_na = arrays['cortar_sin_peg']
+
+    values = np.zeros_like(peg_values)
+    na = np.ones_like(peg_na)
+
+    # NOTE: later rules take precedence over earlier ones
+    rules = [
+        # known peg carriers
+        (~peg_na & (peg == 1), peg_values, peg_values_na),
+        # known peg non-carriers
+        (~peg_na & (peg == 0), nopeg_values, nopeg_values_na),
+        # we only score peg version of cutting item for peg carriers
+        (peg_na & ~peg_values_na & (peg_values != 0), peg_values, peg_values_na),
+        # we only score non-peg version of cutting item for peg non-carriers
+        (peg_na & ~nopeg_values_na & (nopeg_values != 0), nopeg_values, nopeg_values_na),
+        # we don't know peg status, but it doesn't matter
+        (~peg_values_na & ~nopeg_values_na & (peg_values == nopeg_values), peg_values, peg_values_na),
+    ]
+
+    for mask, rule_values, rule_na in rules:
+        values = np.where(mask, rule_values, values)
+        na = np.where(mask, rule_na, na)
+
+    return np.where(na, 0, values), na
+
+
+def evaluate_conditions(arrays: ScoreArrays, conditions: Sequence[Tuple[str, str, Any]],
+                         skipna: bool) -> Tuple[np.ndarray, np.ndarray]:
+    involved = None
+    unknown = None
+    for col, op, value in conditions:
+        values, na = arrays[col]
+        hit = ~na & _STAGING_OPERATORS[op](values, value)
+        involved = hit if involved is None else involved | hit
+        unknown = na if unknown is None else unknown | na
+
+    if skipna:
+        return involved, np.zeros_like(involved)
+    return involved, unknown & ~involved
+
+
+def _calculate_staging(arrays: ScoreArrays, spec: Dict[str, Any], index: pd.Index) -> pd.Series:
+    stage = np.zeros(len(index), dtype='int64')
+    na = np.zeros(len(index), dtype=bool)
+    for skipna, conditions in spec['domains'].values():
+        involved, unknown = evaluate_conditions(arrays, conditions, skipna)
+        stage += involved
+        na |= unknown
+
+    if 'categories' not in spec:
+        return _to_int_series(stage, na, index)
+
+    codes = np.where(na, -1, stage)
+    for label, conditions in spec.get('overrides', {}).items():
+        involved, _ = evaluate_conditions(arrays, conditions, skipna=True)
+        codes = np.where(involved, spec['categories'].index(label), codes)
+
+    return pd.Series(pd.Categorical.from_codes(codes, categories=spec['categories']), index=index)
 
 
 def _add_calculated_fields(df: pd.DataFrame, inplace: bool = False) -> Optional[pd.DataFrame]:
     if not inplace:
         df = df.copy()
 
-    # known peg carriers
-    cutting_peg = df[df.portador_peg == True].cortar_con_peg
-    df.loc[cutting_peg.index, 'cortar'] = cutting_peg
-
-    # known peg non-carriers
-    cutting_nopeg = df[df.portador_peg == False].cortar_sin_peg
-    df.loc[cutting_nopeg.index, 'cortar'] = cutting_nopeg
+    arrays = ScoreArrays(df)
+    arrays['cortar'] = _resolve_cutting_item(arrays)
+    df['cortar'] = _to_int_series(*arrays['cortar'], df.index)
 
-    # we only score peg version of cutting item for peg carriers
-    cutting_peg_nonzero = df[df.portador_peg.isna() & (df.cortar_con_peg != 0)].cortar_con_peg
-    df.loc[cutting_peg_nonzero.index, 'cortar'] = cutting_peg_nonzero
+    for name, columns in ALSFRS_SUBSCORES.items():
+        values = np.zeros(len(df))
+        na = np.zeros(len(df), dtype=bool)
+        for col in columns:
+            col_values, col_na = arrays[col]
+            values += np.where(col_na, 0, col_values)
+            na |= col_na
+        df[name] = _to_int_series(values, na, df.index)
 
-    # we only score non-peg version of cutting item for peg non-carriers
-    cutting_nopeg_nonzero = df[df.portador_peg.isna() & (df.cortar_sin_peg != 0)].cortar_sin_peg
-    df.loc[cutting_nopeg_nonzero.index, 'cortar'] = cutting_nopeg_nonzero
-
-    # we don't know peg status, but it doesn't matter
-    cutting_all_equal = df[df.cortar_con_peg == df.cortar_sin_peg].cortar_con_peg
-    df.loc[cutting_all_equal.index, 'cortar'] = cutting_all_equal
-
-    df['alsfrs_bulbar_c'] = df[ALSFRS_BULBAR_COLUMNS].sum(axis=1, skipna=False).astype('Int64')
-    df['alsfrs_fine_motor_c'] = df[ALSFRS_FINE_MOTOR_COLUMNS].sum(axis=1, skipna=False).astype('Int64')
-    df['alsfrs_gross_motor_c'] = df[ALSFRS_GROSS_MOTOR_COLUMNS].sum(axis=1, skipna=False).astype('Int64')
-    df['alsfrs_respiratory_c'] = df[ALSFRS_RESPIRATORY_COLUMNS].sum(axis=1, skipna=False).astype('Int64')
-    df['alsfrs_total_c'] = df[ALSFRS_TOTAL_COLUMNS].sum(axis=1, skipna=False).astype('Int64')
-
-    df['kings_c'] = _calculate_kings_from_alsfrs(df)
-    df['mitos_c'] = _calculate_mitos_from_alsfrs(df)
+    for name, spec in STAGING_SYSTEMS.items():
+        df[name] = _calculate_staging(arrays, spec, df.index)
 
     if not inplace:
         return df
 
 
-def load_followup_data(datadir: Path = None, alsfrs_data: pd.DataFrame = None,
-                       nutr_data: pd.DataFrame = None, resp_data: pd.DataFrame = None) -> pd.DataFrame:
-    alsfrs_data = alsfrs_data if alsfrs_data is not None else load_data(datadir, 'ufmn/alsfrs')
-    nutr_data = nutr_data if nutr_data is not None else load_data(datadir, 'ufmn/nutr')
-    resp_data = resp_data if resp_data is not None else load_data(datadir, 'ufmn/resp')
+def _coalesce_visits(df: pd.DataFrame, on: Sequence[str]) -> pd.DataFrame:
+    # NOTE: same-day visits are coalesced column by column, keeping the first
+    # recorded non-null value, so later records only fill gaps of earlier ones
+    return df.groupby(on, sort=True).first()
 
-    followups = alsfrs_data.merge(nutr_data, how='outer', on=['id_paciente', 'fecha_visita'])
-    followups = followups.merge(resp_data, how='outer', on=['id_paciente', 'fecha_visita'])
-    followups.dropna(subset=['id_paciente', 'fecha_visita'], inplace=True)
 
-    followups = (followups.set_index(['id_paciente', 'fecha_visita'])
-                 .groupby(level=[0, 1]).bfill().reset_index()
-                 .drop_duplicates(['id_paciente', 'fecha_visita']))
+def align_visits(tables: Sequence[pd.DataFrame], on: Sequence[str] = VISIT_KEY_COLUMNS) -> pd.DataFrame:
+    # NOTE: tables are reduced to one row per visit and sorted by key first, so
+    # they can be combined with one-to-one merges over sorted unique indexes
+    aligned, *others = [_coalesce_visits(df, on) for df in tables]
+    for other in others:
+        aligned = aligned.merge(other, how='outer', left_index=True, right_index=True)
+    return aligned.reset_index()
 
+
+def _build_followup_data(alsfrs_data: pd.DataFrame, nutr_data: pd.DataFrame,
+                         resp_data: pd.DataFrame) -> pd.DataFrame:
+    followups = align_visits([alsfrs_data, nutr_data, resp_data])
     _add_calculated_fields(followups, inplace=True)
     return followups
+
+
+def load_followup_data(datadir: Path = None, alsfrs_data: pd.DataFrame = None,
+                       nutr_data: pd.DataFrame = None, resp_data: pd.DataFrame = None,
+                       scored_alsfrs_fields: Sequence[str] = None) -> pd.DataFrame:
+    def build_followup_data() -> pd.DataFrame:
+        alsfrs = alsfrs_data if alsfrs_data is not None else load_data(datadir, 'ufmn/alsfrs')
+        if scored_alsfrs_fields is not None:
+            alsfrs = alsfrs.dropna(how='all', subset=scored_alsfrs_fields)
+        nutr = nutr_data if nutr_data is not None else load_data(datadir, 'ufmn/nutr')
+        resp = resp_data if resp_data is not None else load_data(datadir, 'ufmn/resp')
+        return _build_followup_data(alsfrs, nutr, resp)
+
+    if datadir is None:
+        return build_followup_data()
+
+    # NOTE: follow-ups built only from ALSFRS-R assessments with some item scored
+    # are materialized apart from the complete ones; tables given along with the
+    # datadir are expected to be the ones stored in it, which the materialized
+    # data is keyed by
+    name = 'ufmn/followups' if scored_alsfrs_fields is None else 'ufmn/followups_scored'
+    version = f'{FOLLOWUP_VERSION}:{scored_alsfrs_fields!r}'
+    return load_materialized_data(datadir, name, FOLLOWUP_INPUTS, build_followup_data, version)
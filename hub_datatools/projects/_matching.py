@@ -0,0 +1,47 @@
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+MATCH_DIRECTIONS = ['backward', 'forward', 'nearest']
+
+_MATCH_KEY = '_match_key'
+_MATCH_ROW = '_match_row'
+
+
+def _to_match_frame(df: pd.DataFrame, on: str, by: str, columns: Sequence[str]) -> pd.DataFrame:
+    df = df.reset_index() if by not in df.columns or on not in df.columns else df
+    frame = df.loc[:, [by] + [col for col in columns if col not in (by, _MATCH_KEY)]]
+    frame[_MATCH_KEY] = pd.to_datetime(df[on]).astype('datetime64[ns]').to_numpy()
+    frame[_MATCH_ROW] = np.arange(len(frame))
+    frame = frame[frame[_MATCH_KEY].notna() & frame[by].notna()]
+    return frame.sort_values(_MATCH_KEY, kind='stable')
+
+
+def match_visits(events: pd.DataFrame, visits: pd.DataFrame, on: str = 'inicio_episodio',
+                 visit_on: str = 'fecha_visita', by: str = 'id_paciente',
+                 direction: str = 'backward', tolerance: Union[str, pd.Timedelta, None] = None,
+                 columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    if direction not in MATCH_DIRECTIONS:
+        raise ValueError(f'invalid match direction: {direction}')
+
+    # NOTE: both sides are sorted once by date and matched with a single as-of
+    # merge grouped by patient, so memory grows with the number of rows instead
+    # of with the number of event and visit pairs of each patient
+    if columns is None:
+        columns = [col for col in visits.reset_index().columns if col != by]
+    columns = [visit_on] + [col for col in columns if col != visit_on]
+
+    left = _to_match_frame(events, on, by, [])
+    right = _to_match_frame(visits, visit_on, by, columns).drop(columns=_MATCH_ROW)
+
+    if tolerance is not None:
+        tolerance = pd.Timedelta(tolerance)
+
+    matched = pd.merge_asof(left, right, on=_MATCH_KEY, by=by,
+                            direction=direction, tolerance=tolerance)
+
+    result = pd.DataFrame(index=np.arange(len(events)))
+    result = result.join(matched.set_index(_MATCH_ROW)[columns])
+    return result.set_axis(events.index)
@@ -0,0 +1,183 @@
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from hub_datatools.projects._followup import ScoreArrays, evaluate_conditions
+
+
+AVERAGE_MONTH_DAYS = 365.25 / 12
+
+ALSFRS_MAX_SCORE = 48
+
+ALSFRS_THRESHOLDS = [36, 24, 12]
+
+# NOTE: milestones are reached at the first visit matching any of their
+# conditions, which also define respiratory support in project exports
+PROGRESSION_MILESTONES = {
+    'niv': [('insuf_resp', '==', 1)],
+    'imv': [('insuf_resp', '==', 0)],
+    'peg': [('portador_peg', '==', True)],
+}
+
+
+def _get_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    return pd.Series(df.index.get_level_values(name), index=df.index)
+
+
+def _to_days(data: pd.Series) -> np.ndarray:
+    days = pd.to_datetime(data).to_numpy(dtype='datetime64[D]').astype('float64')
+    days[pd.isna(data).to_numpy()] = np.nan
+    return days
+
+
+def _sort_by_patient(df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+    ids = _get_column(df, 'id_paciente')
+    dates = _get_column(df, 'fecha_visita')
+    keys = pd.MultiIndex.from_arrays([ids, dates])
+    if keys.is_monotonic_increasing:
+        return df, None
+    order = keys.argsort()
+    return df.iloc[order], order
+
+
+def _segment_starts(ids: np.ndarray) -> np.ndarray:
+    # NOTE: rows are sorted by patient, so each patient is a contiguous segment
+    if len(ids) == 0:
+        return np.zeros(0, dtype='int64')
+    return np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+
+
+def _first_in_segments(mask: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    if len(starts) == 0:
+        return np.zeros(0, dtype='int64')
+    positions = np.where(mask, np.arange(len(mask)), len(mask))
+    return np.minimum.reduceat(positions, starts)
+
+
+def _take_or_nan(values: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    found = positions < len(values)
+    result = np.full(len(positions), np.nan)
+    result[found] = values[positions[found]]
+    return result
+
+
+def _days_to_dates(days: np.ndarray) -> pd.Series:
+    return pd.to_datetime(pd.Series(days), unit='D')
+
+
+def _onset_days(ids: pd.Series, onset: pd.Series) -> np.ndarray:
+    return _to_days(onset.reindex(ids.to_numpy()).reset_index(drop=True))
+
+
+def calculate_visit_progression(followups: pd.DataFrame, onset: pd.Series,
+                                score: str = 'alsfrs_total_c') -> pd.DataFrame:
+    df, order = _sort_by_patient(followups)
+    ids = _get_column(df, 'id_paciente')
+    days = _to_days(_get_column(df, 'fecha_visita'))
+    values = df[score].to_numpy(dtype='float64', na_value=np.nan)
+
+    result = pd.DataFrame(index=df.index)
+    months_onset = (days - _onset_days(ids, onset)) / AVERAGE_MONTH_DAYS
+    result['months_since_onset'] = months_onset
+    result['progression_rate_onset'] = np.where(
+        months_onset > 0, (ALSFRS_MAX_SCORE - values) / months_onset, np.nan)
+
+    # NOTE: consecutive differences are taken between scored visits only, and
+    # the first scored visit of each patient has no previous one
+    scored = np.flatnonzero(~np.isnan(values))
+    starts = _segment_starts(ids.to_numpy()[scored])
+    delta = np.r_[np.nan, np.diff(values[scored])]
+    months = np.r_[np.nan, np.diff(days[scored])] / AVERAGE_MONTH_DAYS
+    delta[starts] = np.nan
+    months[starts] = np.nan
+
+    result['alsfrs_delta'] = np.nan
+    result['months_since_previous'] = np.nan
+    result.iloc[scored, result.columns.get_loc('alsfrs_delta')] = delta
+    result.iloc[scored, result.columns.get_loc('months_since_previous')] = months
+    result['progression_rate_previous'] = np.where(
+        result.months_since_previous > 0, -result.alsfrs_delta / result.months_since_previous, np.nan)
+
+    # NOTE: rows are restored to their original order by position, as visits
+    # are usually indexed by patient and their labels are not unique
+    if order is not None:
+        positions = np.empty_like(order)
+        positions[order] = np.arange(len(order))
+        result = result.iloc[positions]
+    return result
+
+
+def _calculate_slopes(x: np.ndarray, y: np.ndarray, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # NOTE: least squares slopes per patient from segmented sums
+    n = np.add.reduceat(np.ones_like(x), starts)
+    sx = np.add.reduceat(x, starts)
+    sy = np.add.reduceat(y, starts)
+    sxx = np.add.reduceat(x * x, starts)
+    sxy = np.add.reduceat(x * y, starts)
+    denom = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = np.where((n > 1) & (denom > 0), (n * sxy - sx * sy) / denom, np.nan)
+    return n, slopes
+
+
+def calculate_patient_progression(followups: pd.DataFrame, patients: pd.DataFrame,
+                                  score: str = 'alsfrs_total_c',
+                                  thresholds: Sequence[int] = ALSFRS_THRESHOLDS,
+                                  milestones: Dict[str, Sequence[Tuple[str, str, Any]]] = PROGRESSION_MILESTONES) -> pd.DataFrame:
+    df, _ = _sort_by_patient(followups)
+    ids = _get_column(df, 'id_paciente').to_numpy()
+    days = _to_days(_get_column(df, 'fecha_visita'))
+    values = df[score].to_numpy(dtype='float64', na_value=np.nan)
+    onset = _to_days(patients.inicio_clinica)
+    onset = pd.Series(onset, index=patients.index)
+
+    result = pd.DataFrame(index=patients.index)
+
+    scored = ~np.isnan(values) & ~np.isnan(days)
+    scored_ids = ids[scored]
+    starts = _segment_starts(scored_ids)
+    if len(starts) > 0:
+        patient_ids = scored_ids[starts]
+        x = days[scored] / AVERAGE_MONTH_DAYS
+        y = values[scored]
+        n, slopes = _calculate_slopes(x, y, starts)
+        first = pd.Series(days[scored][starts], index=patient_ids)
+        last_positions = np.r_[starts[1:], len(y)] - 1
+
+        result['n_visits'] = pd.Series(n, index=patient_ids).astype('Int64')
+        result['first_visit'] = _days_to_dates(first.to_numpy()).set_axis(patient_ids)
+        result['last_visit'] = _days_to_dates(days[scored][last_positions]).set_axis(patient_ids)
+        result['alsfrs_slope'] = pd.Series(slopes, index=patient_ids)
+
+        months = (first - onset.reindex(patient_ids)) / AVERAGE_MONTH_DAYS
+        rate = (ALSFRS_MAX_SCORE - y[starts]) / months.to_numpy()
+        result['progression_rate_first_visit'] = pd.Series(
+            np.where(months.to_numpy() > 0, rate, np.nan), index=patient_ids)
+
+        for threshold in thresholds:
+            positions = _first_in_segments(y < threshold, starts)
+            below = _take_or_nan(days[scored], positions)
+            result[f'first_below_{threshold}'] = _days_to_dates(below).set_axis(patient_ids)
+
+    all_starts = _segment_starts(ids)
+    if len(all_starts) > 0:
+        arrays = ScoreArrays(df)
+        patient_ids = ids[all_starts]
+        for name, conditions in milestones.items():
+            reached, _ = evaluate_conditions(arrays, conditions, skipna=True)
+            reached &= ~np.isnan(days)
+            milestone = _take_or_nan(days, _first_in_segments(reached, all_starts))
+            result[name] = _days_to_dates(milestone).set_axis(patient_ids)
+
+    death = _to_days(patients.fecha_exitus)
+    result['death'] = _days_to_dates(death).set_axis(patients.index)
+
+    for name in list(milestones.keys()) + ['death']:
+        if name in result.columns:
+            milestone = _to_days(result[name])
+            result[f'months_to_{name}'] = (milestone - onset.to_numpy()) / AVERAGE_MONTH_DAYS
+
+    return result
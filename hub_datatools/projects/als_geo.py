@@ -1,34 +1,40 @@
 import logging
-from pathlib import Path
-from typing import Dict
 
 from pandas import DataFrame
 
-from hub_datatools.serialize import load_data
-from hub_datatools.projects import Project, project
+from hub_datatools.projects import Project, project, sheet, step
 from hub_datatools.projects._followup import load_followup_data
 
 
 @project('als-geo')
 class ALSGeo(Project):
 
-    def __init__(self, datadir: Path):
-        patients = load_data(datadir, 'ufmn/patients').sort_index()
+    tables = ['ufmn/patients', 'ufmn/alsfrs', 'ufmn/nutr', 'ufmn/resp']
+
+    @step('patients', inputs=['ufmn/patients', 'ufmn/alsfrs', 'ufmn/nutr', 'ufmn/resp'])
+    def _build_patients(self, patients: DataFrame, alsfrs_data: DataFrame,
+                        nutr_data: DataFrame, resp_data: DataFrame) -> DataFrame:
         patients = patients[patients.fecha_exitus.isna()]
         patients = patients[patients.fecha_dx.notna()]
-        followups = load_followup_data(datadir)
+        followups = load_followup_data(self._datadir, alsfrs_data, nutr_data, resp_data)
         followups = followups.merge(patients, on='id_paciente')
-        self._patients = followups.drop_duplicates(subset=['id_paciente'])
+        return followups.drop_duplicates(subset=['id_paciente'])
 
-    def _count_patients_by(self, by: str, count: str = 'Nº pacientes') -> DataFrame:
-        df = self._patients.groupby(by).id_paciente.count()
+    def _count_patients_by(self, patients: DataFrame, by: str, count: str = 'Nº pacientes') -> DataFrame:
+        df = patients.groupby(by).id_paciente.count()
         return df.rename(index=count).sort_values(ascending=False)
 
-    def export_data(self) -> DataFrame | Dict[str, DataFrame]:
-        logging.info('ALS-GEO: Exporting patients location data')
+    @sheet('Municipio', inputs=['patients'])
+    def _export_town_data(self, patients: DataFrame) -> DataFrame:
+        logging.info('ALS-GEO: Exporting patients by town')
+        return self._count_patients_by(patients, 'municipio_residencia').rename_axis('Municipio')
+
+    @sheet('Provincia', inputs=['patients'])
+    def _export_province_data(self, patients: DataFrame) -> DataFrame:
+        logging.info('ALS-GEO: Exporting patients by province')
+        return self._count_patients_by(patients, 'provincia_residencia').rename_axis('Provincia')
 
-        return {
-            'Municipio': self._count_patients_by('municipio_residencia').rename_axis('Municipio'),
-            'Provincia': self._count_patients_by('provincia_residencia').rename_axis('Provincia'),
-            'Código postal': self._count_patients_by('codigo_postal').rename_axis('Código postal').sort_index(),
-        }
+    @sheet('Código postal', inputs=['patients'])
+    def _export_postal_code_data(self, patients: DataFrame) -> DataFrame:
+        logging.info('ALS-GEO: Exporting patients by postal code')
+        return self._count_patients_by(patients, 'codigo_postal').rename_axis('Código postal').sort_index()
@@ -1,14 +1,18 @@
 import logging
-from pathlib import Path
-from typing import Dict
+from typing import Sequence
 
-from pandas import DataFrame
+from pandas import DataFrame, Series
 
-from hub_datatools.serialize import load_data
-from hub_datatools.projects import Project, project
-from hub_datatools.projects._followup import load_followup_data
+from hub_datatools.intervals import EpisodeIntervals
+from hub_datatools.lookup import load_lookup, lookup_values
+from hub_datatools.projects import Project, project, sheet, step
+from hub_datatools.projects._followup import ScoreArrays, evaluate_conditions, load_followup_data
+from hub_datatools.projects._matching import match_visits
+from hub_datatools.projects._progression import PROGRESSION_MILESTONES
 
 
+EPISODE_SOURCES = ['urg', 'hosp']
+
 ALSFRS_FIELDS = [
     'lenguaje',
     'salivacion',
@@ -117,218 +121,275 @@ URG_DISCHARGE_TYPE_CATEGORIES = {
 @project('precision-als')
 class PrecisionALS(Project):
 
-    def __init__(self, datadir: Path):
-        patients = load_data(datadir, 'ufmn/patients').sort_index()
-        self._patients = patients = patients[patients.fecha_dx.notna()]
-
-        alsfrs_data = load_data(datadir, 'ufmn/alsfrs')
-        alsfrs_data.dropna(how='all', subset=ALSFRS_FIELDS, inplace=True)
-
-        nutr_data = load_data(datadir, 'ufmn/nutr')
-        resp_data = load_data(datadir, 'ufmn/resp')
-
-        followups = load_followup_data(datadir, alsfrs_data, nutr_data, resp_data)
+    tables = [
+        'ufmn/patients',
+        'ufmn/alsfrs',
+        'ufmn/nutr',
+        'ufmn/resp',
+        'hub_urg/episodes',
+        'hub_hosp/episodes',
+        'hub_urg/diagnoses',
+        'hub_hosp/diagnoses',
+    ]
+
+    keys = {
+        'patient_id': 'id_paciente',
+        'episode_id': 'id_episodio',
+    }
+
+    @step('patients', inputs=['ufmn/patients'])
+    def _build_patients(self, patients: DataFrame) -> DataFrame:
+        return patients[patients.fecha_dx.notna()]
+
+    @step('followups', inputs=['patients', 'ufmn/alsfrs', 'ufmn/nutr', 'ufmn/resp'])
+    def _build_followups(self, patients: DataFrame, alsfrs_data: DataFrame,
+                         nutr_data: DataFrame, resp_data: DataFrame) -> DataFrame:
+        followups = load_followup_data(self._datadir, alsfrs_data, nutr_data, resp_data,
+                                       scored_alsfrs_fields=ALSFRS_FIELDS)
         followups = followups.merge(patients, on='id_paciente')
         followups = followups.set_index('id_paciente').sort_index()
-        self._followups = followups = followups[followups.fecha_dx.notna()]
-
-        urg_episodes = load_data(datadir, 'hub_urg/episodes')
-        hosp_episodes = load_data(datadir, 'hub_hosp/episodes')
-        self._urg_diagnoses = load_data(datadir, 'hub_urg/diagnoses')
-        self._hosp_diagnoses = load_data(datadir, 'hub_hosp/diagnoses')
-
-        self._alsfrs_data = (alsfrs_data.reset_index()
-                             .merge(followups, on=['id_paciente', 'fecha_visita'], suffixes=[None, '_x'])
-                             .set_index(['id_paciente', 'fecha_visita']).sort_index())
-
-        self._nutr_data = (nutr_data.reset_index()
-                           .set_index(['id_paciente', 'fecha_visita']).sort_index())
-
-        self._resp_data = (resp_data.reset_index()
-                           .set_index(['id_paciente', 'fecha_visita']).sort_index())
-
-        self._urg_episodes = (urg_episodes.reset_index()
-                              .merge(self._patients.reset_index(), on='nhc')
-                              .sort_values(['id_paciente', 'inicio_episodio'])
-                              .set_index(['id_paciente', 'id_episodio']))
-
-        self._hosp_episodes = (hosp_episodes.reset_index()
-                               .merge(self._patients.reset_index(), on='nhc')
-                               .sort_values(['id_paciente', 'inicio_episodio'])
-                               .set_index(['id_paciente', 'id_episodio']))
-
-    def _export_patient_data(self) -> DataFrame:
+        return followups[followups.fecha_dx.notna()]
+
+    @step('alsfrs_data', inputs=['ufmn/alsfrs', 'followups'])
+    def _build_alsfrs_data(self, alsfrs_data: DataFrame, followups: DataFrame) -> DataFrame:
+        alsfrs_data = alsfrs_data.dropna(how='all', subset=ALSFRS_FIELDS)
+        return (alsfrs_data.reset_index()
+                .merge(followups, on=['id_paciente', 'fecha_visita'], suffixes=[None, '_x'])
+                .set_index(['id_paciente', 'fecha_visita']).sort_index())
+
+    @step('nutr_data', inputs=['ufmn/nutr'])
+    def _build_nutr_data(self, nutr_data: DataFrame) -> DataFrame:
+        return nutr_data.reset_index().set_index(['id_paciente', 'fecha_visita']).sort_index()
+
+    @step('resp_data', inputs=['ufmn/resp'])
+    def _build_resp_data(self, resp_data: DataFrame) -> DataFrame:
+        return resp_data.reset_index().set_index(['id_paciente', 'fecha_visita']).sort_index()
+
+    @step('nhc_lookup')
+    def _build_nhc_lookup(self) -> Series:
+        # NOTE: NHCs shared by several patients cannot link episodes to any of
+        # them, so they are left out instead of failing the whole export
+        lookup = load_lookup(self._datadir, 'nhc')
+        duplicated = lookup.index.duplicated(keep=False)
+        if duplicated.any():
+            nhcs = lookup.index[duplicated].unique()
+            logging.warning(f'Precision ALS: Ignoring episodes of {len(nhcs)} NHCs shared by several '
+                            f'patients: {", ".join(map(str, nhcs[:5]))}')
+        return lookup[~duplicated]
+
+    def _build_episodes(self, episodes: DataFrame, patients: DataFrame, nhc_lookup: Series) -> DataFrame:
+        # NOTE: episodes are linked to patients through the NHC lookup, without
+        # merging the rest of patient data into them
+        episodes = episodes.reset_index()
+        episodes['id_paciente'] = lookup_values(nhc_lookup, episodes.nhc, validate='many_to_one')
+        episodes = episodes[episodes.id_paciente.isin(patients.index)]
+        episodes = episodes.astype({'id_paciente': patients.index.dtype})
+        return (episodes.sort_values(['id_paciente', 'inicio_episodio'])
+                .set_index(['id_paciente', 'id_episodio']))
+
+    @step('urg_episodes', inputs=['hub_urg/episodes', 'patients', 'nhc_lookup'])
+    def _build_urg_episodes(self, episodes: DataFrame, patients: DataFrame, nhc_lookup: Series) -> DataFrame:
+        return self._build_episodes(episodes, patients, nhc_lookup)
+
+    @step('hosp_episodes', inputs=['hub_hosp/episodes', 'patients', 'nhc_lookup'])
+    def _build_hosp_episodes(self, episodes: DataFrame, patients: DataFrame, nhc_lookup: Series) -> DataFrame:
+        return self._build_episodes(episodes, patients, nhc_lookup)
+
+    def match_episode_visits(self, episodes: str = 'urg', direction: str = 'backward',
+                             tolerance: str = None, columns: Sequence[str] = None) -> DataFrame:
+        if episodes not in EPISODE_SOURCES:
+            raise ValueError(f'invalid episodes: {episodes}')
+
+        name = f'{episodes}_episodes'
+        data = self.compute([name, 'followups'])
+        return match_visits(data[name], data['followups'], direction=direction,
+                            tolerance=tolerance, columns=columns)
+
+    def find_episode_visits(self, episodes: str = 'hosp') -> DataFrame:
+        # NOTE: follow-up visits are matched to the episodes ongoing at their
+        # date through the episode intervals index
+        if episodes not in EPISODE_SOURCES:
+            raise ValueError(f'invalid episodes: {episodes}')
+
+        name = f'hub_{episodes}/episodes'
+        intervals = EpisodeIntervals.load(self._datadir, name)
+        followups = self.compute(['followups'])['followups']
+        matched = intervals.stab(followups.index, followups.fecha_visita)
+        visits = followups.iloc[matched['query']].reset_index()
+        return visits.assign(id_episodio=matched.id_episodio.to_numpy())
+
+    def _first_milestone(self, alsfrs_data: DataFrame, name: str) -> Series:
+        reached, _ = evaluate_conditions(ScoreArrays(alsfrs_data), PROGRESSION_MILESTONES[name], skipna=True)
+        return alsfrs_data[reached].reset_index().groupby('id_paciente').fecha_visita.min()
+
+    @sheet('Patients', inputs=['patients', 'followups', 'alsfrs_data'])
+    def _export_patient_data(self, patients: DataFrame, followups: DataFrame, alsfrs_data: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting patient data')
 
         return DataFrame({
-            'nhc': self._patients.nhc,
-            'cip': self._patients.cip,
-            'birthdate': self._patients.fecha_nacimiento,
-            'sex': self._patients.sexo.map(SEX_CATEGORIES),
-            'smoking': self._patients.fumador.map(SMOKING_CATEGORIES),
-            'fh_als': self._patients.historia_familiar_motoneurona,
-            'fh_alzheimer': self._patients.historia_familiar_alzheimer,
-            'fh_parkinson': self._patients.historia_familiar_parkinson,
-            'cognitive_imp': self._patients.deterioro_cognitivo,
-            'cognitive_dx': self._patients.estudio_cognitivo.map(COGNITIVE_DX_CATEGORIES),
-            'clinical_onset': self._patients.inicio_clinica,
-            'phenotype_dx': self._patients.fenotipo_dx.map(PHENOTYPE_CATEGORIES),
-            'phenotype_death': self._patients.fenotipo_exitus.map(PHENOTYPE_CATEGORIES),
-            'mn_involvement': self._patients.afectacion_mn.map(MN_INVOLVEMENT_CATEGORIES),
-            'weakness_pattern': self._patients.patron_debilidad.map(WEAKNESS_PATTERN_CATEGORIES),
-            'dx_date': self._patients.fecha_dx,
-            'riluzole_received': self._patients.riluzol,
-            'riluzole_start': self._patients.inicio_riluzol,
-            'last_followup': self._followups.groupby('id_paciente').fecha_visita.max(),
-            'niv_support': self._alsfrs_data[self._alsfrs_data.insuf_resp == 1].reset_index().groupby('id_paciente').fecha_visita.min(),
-            'imv_support': self._alsfrs_data[self._alsfrs_data.insuf_resp == 0].reset_index().groupby('id_paciente').fecha_visita.min(),
-            'death': self._patients.fecha_exitus,
+            'nhc': patients.nhc,
+            'cip': patients.cip,
+            'birthdate': patients.fecha_nacimiento,
+            'sex': patients.sexo.map(SEX_CATEGORIES),
+            'smoking': patients.fumador.map(SMOKING_CATEGORIES),
+            'fh_als': patients.historia_familiar_motoneurona,
+            'fh_alzheimer': patients.historia_familiar_alzheimer,
+            'fh_parkinson': patients.historia_familiar_parkinson,
+            'cognitive_imp': patients.deterioro_cognitivo,
+            'cognitive_dx': patients.estudio_cognitivo.map(COGNITIVE_DX_CATEGORIES),
+            'clinical_onset': patients.inicio_clinica,
+            'phenotype_dx': patients.fenotipo_dx.map(PHENOTYPE_CATEGORIES),
+            'phenotype_death': patients.fenotipo_exitus.map(PHENOTYPE_CATEGORIES),
+            'mn_involvement': patients.afectacion_mn.map(MN_INVOLVEMENT_CATEGORIES),
+            'weakness_pattern': patients.patron_debilidad.map(WEAKNESS_PATTERN_CATEGORIES),
+            'dx_date': patients.fecha_dx,
+            'riluzole_received': patients.riluzol,
+            'riluzole_start': patients.inicio_riluzol,
+            'last_followup': followups.groupby('id_paciente').fecha_visita.max(),
+            'niv_support': self._first_milestone(alsfrs_data, 'niv'),
+            'imv_support': self._first_milestone(alsfrs_data, 'imv'),
+            'death': patients.fecha_exitus,
         }).rename_axis('patient_id')
 
-    def _export_genetic_data(self) -> DataFrame:
+    @sheet('Genetics', inputs=['patients'])
+    def _export_genetic_data(self, patients: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting genetic data')
 
         return DataFrame({
-            'c9_status': self._patients.estado_c9.map(GENE_STATUS_CATEGORIES),
-            'sod1_status': self._patients.estado_sod1.map(GENE_STATUS_CATEGORIES),
-            'atxn2_status': self._patients.estado_atxn2.map(GENE_STATUS_CATEGORIES),
+            'c9_status': patients.estado_c9.map(GENE_STATUS_CATEGORIES),
+            'sod1_status': patients.estado_sod1.map(GENE_STATUS_CATEGORIES),
+            'atxn2_status': patients.estado_atxn2.map(GENE_STATUS_CATEGORIES),
         }).rename_axis('patient_id')
 
-    def _export_alsfrs_data(self) -> DataFrame:
+    @sheet('ALSFRS-R', inputs=['alsfrs_data'])
+    def _export_alsfrs_data(self, alsfrs_data: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting ALSFRS-R assesments data')
 
         return DataFrame({
-            'speech': self._alsfrs_data.lenguaje,
-            'salivation': self._alsfrs_data.salivacion,
-            'swallowing': self._alsfrs_data.deglucion,
-            'handwriting': self._alsfrs_data.escritura,
-            'cutting': self._alsfrs_data.cortar,
-            'cutting_peg': self._alsfrs_data.cortar_con_peg.where(
-                self._alsfrs_data.portador_peg.fillna(True)
+            'speech': alsfrs_data.lenguaje,
+            'salivation': alsfrs_data.salivacion,
+            'swallowing': alsfrs_data.deglucion,
+            'handwriting': alsfrs_data.escritura,
+            'cutting': alsfrs_data.cortar,
+            'cutting_peg': alsfrs_data.cortar_con_peg.where(
+                alsfrs_data.portador_peg.fillna(True)
             ),
-            'cutting_no_peg': self._alsfrs_data.cortar_sin_peg.where(
-                self._alsfrs_data.portador_peg.fillna(False) == False
+            'cutting_no_peg': alsfrs_data.cortar_sin_peg.where(
+                alsfrs_data.portador_peg.fillna(False) == False
             ),
-            'dressing': self._alsfrs_data.vestido,
-            'bed': self._alsfrs_data.cama,
-            'walking': self._alsfrs_data.caminar,
-            'stairs': self._alsfrs_data.subir_escaleras,
-            'dyspnea': self._alsfrs_data.disnea,
-            'orthopnea': self._alsfrs_data.ortopnea,
-            'resp_insuf': self._alsfrs_data.insuf_resp,
-            'alsfrs_bulbar': self._alsfrs_data.alsfrs_bulbar_c,
-            'alsfrs_fine_motor': self._alsfrs_data.alsfrs_fine_motor_c,
-            'alsfrs_gross_motor': self._alsfrs_data.alsfrs_gross_motor_c,
-            'alsfrs_respiratory': self._alsfrs_data.alsfrs_respiratory_c,
-            'alsfrs_total': self._alsfrs_data.alsfrs_total_c.where(
-                self._alsfrs_data.alsfrs_total_c.notna(),
-                self._alsfrs_data.alsfrs_total
+            'dressing': alsfrs_data.vestido,
+            'bed': alsfrs_data.cama,
+            'walking': alsfrs_data.caminar,
+            'stairs': alsfrs_data.subir_escaleras,
+            'dyspnea': alsfrs_data.disnea,
+            'orthopnea': alsfrs_data.ortopnea,
+            'resp_insuf': alsfrs_data.insuf_resp,
+            'alsfrs_bulbar': alsfrs_data.alsfrs_bulbar_c,
+            'alsfrs_fine_motor': alsfrs_data.alsfrs_fine_motor_c,
+            'alsfrs_gross_motor': alsfrs_data.alsfrs_gross_motor_c,
+            'alsfrs_respiratory': alsfrs_data.alsfrs_respiratory_c,
+            'alsfrs_total': alsfrs_data.alsfrs_total_c.where(
+                alsfrs_data.alsfrs_total_c.notna(),
+                alsfrs_data.alsfrs_total
             ),
-            'peg_carrier': self._alsfrs_data.portador_peg,
-            'kings_r': self._alsfrs_data.kings,
-            'kings_c': self._alsfrs_data.kings_c,
-            'mitos': self._alsfrs_data.mitos_c,
+            'peg_carrier': alsfrs_data.portador_peg,
+            'kings_r': alsfrs_data.kings,
+            'kings_c': alsfrs_data.kings_c,
+            'mitos': alsfrs_data.mitos_c,
         }).rename_axis(['patient_id', 'assessment_date'])
 
-    def _export_respiratory_data(self) -> DataFrame:
+    @sheet('Respiratory', inputs=['resp_data'])
+    def _export_respiratory_data(self, resp_data: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting respiratory assesments data')
 
         return DataFrame({
-            'abg_ph': self._resp_data.ph_sangre_arterial,
-            'abg_po2': self._resp_data.pao2,
-            'abg_pco2': self._resp_data.paco2,
-            'abg_hco3': self._resp_data.hco3,
-            'npo_ct90': self._resp_data.ct90,
-            'npo_odi3': self._resp_data.odi3,
-            'npo_mean_spo2': self._resp_data.sao2_media,
-            'npo_mean_spo2_below_threshold': self._resp_data.sao2_media_below_threshold,
-            'pns': self._resp_data.pns,
-            'pcf': self._resp_data.pcf,
-            'pcf_below_threshold': self._resp_data.pcf_below_threshold,
-            'mip': self._resp_data.pim,
-            'mip_below_threshold': self._resp_data.pim_below_threshold,
-            'mep': self._resp_data.pem,
-            'fvc_sitting': self._resp_data.fvc_sentado,
-            'fvc_sitting_abs': self._resp_data.fvc_sentado_absoluto,
-            'fvc_lying': self._resp_data.fvc_estirado,
-            'fvc_lying_abs': self._resp_data.fvc_estirado_absoluto,
-            'psg': self._resp_data.polisomnografia,
-            'psg_date': self._resp_data.fecha_realizacion_polisomnografia,
-            'psg_ct90': self._resp_data.ct90_polisomnografia,
-            'psg_iah': self._resp_data.iah,
-            'psg_mean_spo2': self._resp_data.sao2_media,
-            'psg_obstr_apneas': self._resp_data.sas_apneas_obstructivas,
-            'psg_non_obstr_apneas': self._resp_data.sas_apneas_no_claramente_obstructivas,
-            'psg_central_apneas': self._resp_data.sas_apneas_centrales,
-            'psg_mixed_apneas': self._resp_data.sas_apneas_mixtas,
+            'abg_ph': resp_data.ph_sangre_arterial,
+            'abg_po2': resp_data.pao2,
+            'abg_pco2': resp_data.paco2,
+            'abg_hco3': resp_data.hco3,
+            'npo_ct90': resp_data.ct90,
+            'npo_odi3': resp_data.odi3,
+            'npo_mean_spo2': resp_data.sao2_media,
+            'npo_mean_spo2_below_threshold': resp_data.sao2_media_below_threshold,
+            'pns': resp_data.pns,
+            'pcf': resp_data.pcf,
+            'pcf_below_threshold': resp_data.pcf_below_threshold,
+            'mip': resp_data.pim,
+            'mip_below_threshold': resp_data.pim_below_threshold,
+            'mep': resp_data.pem,
+            'fvc_sitting': resp_data.fvc_sentado,
+            'fvc_sitting_abs': resp_data.fvc_sentado_absoluto,
+            'fvc_lying': resp_data.fvc_estirado,
+            'fvc_lying_abs': resp_data.fvc_estirado_absoluto,
+            'psg': resp_data.polisomnografia,
+            'psg_date': resp_data.fecha_realizacion_polisomnografia,
+            'psg_ct90': resp_data.ct90_polisomnografia,
+            'psg_iah': resp_data.iah,
+            'psg_mean_spo2': resp_data.sao2_media,
+            'psg_obstr_apneas': resp_data.sas_apneas_obstructivas,
+            'psg_non_obstr_apneas': resp_data.sas_apneas_no_claramente_obstructivas,
+            'psg_central_apneas': resp_data.sas_apneas_centrales,
+            'psg_mixed_apneas': resp_data.sas_apneas_mixtas,
         }).rename_axis(['patient_id', 'assessment_date'])
 
-    def _export_nutritional_data(self) -> DataFrame:
+    @sheet('Nutritional', inputs=['nutr_data'])
+    def _export_nutritional_data(self, nutr_data: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting nutritional assesments data')
 
         return DataFrame({
-            'weight': self._nutr_data.peso,
-            'height': self._nutr_data.estatura,
-            'bmi': self._nutr_data.imc,
-            'peg_indication': self._nutr_data.indicacion_peg,
-            'peg_indication_date': self._nutr_data.fecha_indicacion_peg,
-            'peg_carrier': self._nutr_data.portador_peg,
-            'peg_colocation_date': self._nutr_data.fecha_colocacion_peg,
-            'peg_removal': self._nutr_data.retirada_peg,
-            'peg_removal_date': self._nutr_data.fecha_retirada_peg,
-            'dysphagia': self._nutr_data.disfagia.map(DYSPHAGIA_CATEGORIES),
-            'food_thickener_usage': self._nutr_data.espesante,
-            'food_thickener_start': self._nutr_data.inicio_espesante,
-            'oral_supplementation': self._nutr_data.supl_oral,
-            'oral_supplementation_start': self._nutr_data.inicio_supl_oral,
-            'enteric_supplementation': self._nutr_data.supl_enteral,
-            'enteric_supplementation_start': self._nutr_data.inicio_supl_enteral,
-            'constipation': self._nutr_data.estreñimiento,
-            'laxative_usage': self._nutr_data.laxante,
+            'weight': nutr_data.peso,
+            'height': nutr_data.estatura,
+            'bmi': nutr_data.imc,
+            'peg_indication': nutr_data.indicacion_peg,
+            'peg_indication_date': nutr_data.fecha_indicacion_peg,
+            'peg_carrier': nutr_data.portador_peg,
+            'peg_colocation_date': nutr_data.fecha_colocacion_peg,
+            'peg_removal': nutr_data.retirada_peg,
+            'peg_removal_date': nutr_data.fecha_retirada_peg,
+            'dysphagia': nutr_data.disfagia.map(DYSPHAGIA_CATEGORIES),
+            'food_thickener_usage': nutr_data.espesante,
+            'food_thickener_start': nutr_data.inicio_espesante,
+            'oral_supplementation': nutr_data.supl_oral,
+            'oral_supplementation_start': nutr_data.inicio_supl_oral,
+            'enteric_supplementation': nutr_data.supl_enteral,
+            'enteric_supplementation_start': nutr_data.inicio_supl_enteral,
+            'constipation': nutr_data.estreñimiento,
+            'laxative_usage': nutr_data.laxante,
         }).rename_axis(['patient_id', 'assessment_date'])
 
-    def _export_ER_episodes_data(self) -> DataFrame:
+    @sheet('ER Episodes', inputs=['urg_episodes'])
+    def _export_ER_episodes_data(self, episodes: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting ER episodes data')
 
         return DataFrame({
-            'admission_date': self._urg_episodes.inicio_episodio,
-            'discharge_date': self._urg_episodes.fin_episodio,
-            'discharge_type': self._urg_episodes.destino_alta.map(URG_DISCHARGE_TYPE_CATEGORIES),
+            'admission_date': episodes.inicio_episodio,
+            'discharge_date': episodes.fin_episodio,
+            'discharge_type': episodes.destino_alta.map(URG_DISCHARGE_TYPE_CATEGORIES),
         }).rename_axis(['patient_id', 'episode_id'])
 
-    def _export_ER_diagnoses_data(self) -> DataFrame:
+    @sheet('ER Diagnoses', inputs=['hub_urg/diagnoses'])
+    def _export_ER_diagnoses_data(self, diagnoses: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting ER diagnoses data')
 
         return DataFrame({
-            'dx_description': self._urg_diagnoses.descripcion_dx,
+            'dx_description': diagnoses.descripcion_dx,
         }).rename_axis(['episode_id', 'dx_code'])
 
-    def _export_hospital_episodes_data(self) -> DataFrame:
+    @sheet('Hospital Episodes', inputs=['hosp_episodes'])
+    def _export_hospital_episodes_data(self, episodes: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting hospitalization episodes data')
 
         return DataFrame({
-            'admission_date': self._hosp_episodes.inicio_episodio,
-            'discharge_date': self._hosp_episodes.fin_episodio,
-            'discharge_type': self._hosp_episodes.destino_alta.map(HOSP_DISCHARGE_TYPE_CATEGORIES),
-            'discharge_department': self._hosp_episodes.servicio_alta,
+            'admission_date': episodes.inicio_episodio,
+            'discharge_date': episodes.fin_episodio,
+            'discharge_type': episodes.destino_alta.map(HOSP_DISCHARGE_TYPE_CATEGORIES),
+            'discharge_department': episodes.servicio_alta,
         }).rename_axis(['patient_id', 'episode_id'])
 
-    def _export_hospital_diagnoses_data(self) -> DataFrame:
+    @sheet('Hospital Diagnoses', inputs=['hub_hosp/diagnoses'])
+    def _export_hospital_diagnoses_data(self, diagnoses: DataFrame) -> DataFrame:
         logging.info('Precision ALS: Exporting hospitalization diagnoses data')
 
         return DataFrame({
-            'dx_description': self._hosp_diagnoses.descripcion_dx,
+            'dx_description': diagnoses.descripcion_dx,
         }).rename_axis(['episode_id', 'dx_code'])
-
-    def export_data(self) -> Dict[str, DataFrame]:
-        return {
-            'Patients': self._export_patient_data(),
-            'Genetics': self._export_genetic_data(),
-            'ALSFRS-R': self._export_alsfrs_data(),
-            'Respiratory': self._export_respiratory_data(),
-            'Nutritional': self._export_nutritional_data(),
-            'ER Episodes': self._export_ER_episodes_data(),
-            'ER Diagnoses': self._export_ER_diagnoses_data(),
-            'Hospital Episodes': self._export_hospital_episodes_data(),
-            'Hospital Diagnoses': self._export_hospital_diagnoses_data(),
-        }
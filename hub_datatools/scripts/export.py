@@ -4,15 +4,15 @@ import sys
 import logging
 from argparse import ArgumentParser
 from pathlib import Path
-from typing import Any, Dict
-
-from pandas import DataFrame, ExcelWriter
+from typing import TYPE_CHECKING, Any, Dict
 
 from hub_datatools import console
-from hub_datatools.datasources import load_datasource_modules
 from hub_datatools.projects import *
 from hub_datatools.serialize import load_data
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
 FORMAT_SUFFIXES = {
     'csv': '.csv',
     'excel': '.xlsx',
@@ -25,7 +25,7 @@ SUFFIX_FORMATS = {
 }
 
 
-def _export_data_csv(data: DataFrame | Dict[str, DataFrame], path: Path, replace: bool = False, **kwargs: Dict[str, Any]) -> None:
+def _export_data_csv(data: 'DataFrame | Dict[str, DataFrame]', path: Path, replace: bool = False, **kwargs: Dict[str, Any]) -> None:
     if isinstance(data, dict):
         for key, child in data.items():
             childpath = path.joinpath(key)
@@ -41,7 +41,7 @@ def _export_data_csv(data: DataFrame | Dict[str, DataFrame], path: Path, replace
         data.to_csv(path, **kwargs)
 
 
-def _export_data_excel(data: DataFrame | Dict[str, DataFrame], path: Path, replace: bool = False, **kwargs: Dict[str, Any]) -> None:
+def _export_data_excel(data: 'DataFrame | Dict[str, DataFrame]', path: Path, replace: bool = False, **kwargs: Dict[str, Any]) -> None:
     if not path.suffix:
         path = path.with_suffix('.xlsx')
 
@@ -50,6 +50,7 @@ def _export_data_excel(data: DataFrame | Dict[str, DataFrame], path: Path, repla
 
     path.parent.mkdir(exist_ok=True)
     if isinstance(data, dict):
+        from pandas import ExcelWriter
         try:
             with ExcelWriter(path) as writer:
                 for key, child in data.items():
@@ -68,7 +69,7 @@ EXPORT_FORMATS = {
 DEFAULT_FORMAT = 'csv'
 
 
-def _export_data(data: DataFrame | Dict[str, DataFrame], path: Path, format: str,
+def _export_data(data: 'DataFrame | Dict[str, DataFrame]', path: Path, format: str,
                  replace: bool = False, **kwargs: Dict[str, Any]) -> None:
     exportfn = EXPORT_FORMATS.get(format)
     if exportfn is None:
@@ -85,6 +86,9 @@ def _make_argument_parser() -> ArgumentParser:
     group.add_argument('-p', '--project', choices=get_project_names(),
                        help='output data for selected project')
 
+    parser.add_argument('--sheets', help='output only selected project sheets')
+    parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                        help='number of project steps to run concurrently')
     parser.add_argument('-f', '--format', choices=EXPORT_FORMATS.keys(),
                         help='file output format to use')
     parser.add_argument('-c', '--columns', help='output only selected data columns')
@@ -100,21 +104,27 @@ def _make_argument_parser() -> ArgumentParser:
 def main() -> None:
     try:
         console.initialize()
-        load_project_modules()
 
         parser = _make_argument_parser()
         args = parser.parse_args()
 
+        from pandas import DataFrame
+        from hub_datatools.keys import decode_keys
+
         logger = logging.getLogger()
         logger.setLevel(logging.DEBUG)
 
         if args.project is not None:
             projectclass = get_project_class(args.project)
             project = projectclass(datadir=args.datadir)
-            data = project.export_data()
+            sheets = args.sheets.split(',') if args.sheets is not None else None
+            data = project.export_data(sheets=sheets, jobs=args.jobs)
+
+        elif args.sheets is not None:
+            parser.error('sheets can only be selected for projects')
 
         elif args.source is not None:
-            data = load_data(args.datadir, args.source)
+            data = decode_keys(args.datadir, load_data(args.datadir, args.source))
 
         else:
             parser.error('no data sources to be exported were given')
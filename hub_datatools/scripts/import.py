@@ -2,11 +2,21 @@
 
 import sys
 import logging
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 from hub_datatools import console
 from hub_datatools.datasources import *
-from hub_datatools.serialize import save_data
+from hub_datatools.serialize import SnapshotWriter
+
+if TYPE_CHECKING:
+    from hub_datatools.keys import KeyRegistry
+
+
+# NOTE: data sources whose data is indexed by the episode interval and code indexes
+INDEXED_SOURCES = ['ufmn', 'hub_urg', 'hub_hosp']
 
 
 def _make_argument_parser() -> ArgumentParser:
@@ -14,6 +24,16 @@ def _make_argument_parser() -> ArgumentParser:
     parser.add_argument('-d', '--datadir', required=True, help='directory to store snapshot data')
     parser.add_argument('-r', '--replace', action='store_true',
                         help='replace snapshot data if already exists')
+    parser.add_argument('--cachedir', type=Path,
+                        help='directory to cache parsed input files (default: DATADIR/.cache)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not cache parsed input files')
+    parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                        help='number of data sources to load concurrently')
+    parser.add_argument('--text-index', action='store_true',
+                        help='also index configured free-text columns for searching')
+    parser.add_argument('--shards', type=int, metavar='N', nargs='?', const=0,
+                        help='also store patient data sharded by patient, into N shards if given')
 
     for name in get_datasource_names():
         group = parser.add_argument_group(name)
@@ -23,31 +43,106 @@ def _make_argument_parser() -> ArgumentParser:
     return parser
 
 
+def _import_datasource(name: str, args: Namespace, keys: 'KeyRegistry') -> None:
+    from hub_datatools.lookup import build_lookups
+
+    datasource_class = get_datasource_class(name)
+    datasource = datasource_class()
+    replace = args.replace or datasource_class.incremental
+    with SnapshotWriter(args.datadir, replace=replace) as writer:
+        for key, chunk in datasource.iter_data(args):
+            chunk = keys.encode_frame(chunk)
+            writer.write(key, chunk)
+            for lookup_key, lookup in build_lookups(key, chunk):
+                writer.write(lookup_key, lookup)
+            del chunk
+
+        # NOTE: key mappings are saved before the tables using them are committed,
+        # so that an import failing midway never leaves keys without a mapping
+        keys.save()
+
+
 def main() -> None:
     try:
         console.initialize()
-        load_datasource_modules()
 
         parser = _make_argument_parser()
         args = parser.parse_args()
 
+        if args.no_cache:
+            args.cachedir = None
+        elif args.cachedir is None:
+            args.cachedir = Path(args.datadir).joinpath('.cache')
+
         logger = logging.getLogger()
         logger.setLevel(logging.DEBUG)
 
-        nsources = 0
-        for name in get_datasource_names():
-            datasource_class = get_datasource_class(name)
-            if not datasource_class.is_active(args):
-                continue
+        names = [name for name in get_datasource_names()
+                 if get_datasource_class(name).is_active(args)]
 
-            datasource = datasource_class()
-            data = datasource.load_data(args)
-            save_data(args.datadir, data, replace=args.replace)
-            nsources += 1
-
-        if nsources == 0:
+        if len(names) == 0:
             parser.error('no data sources given')
 
+        from hub_datatools.codes import build_code_indexes
+        from hub_datatools.datasources._workbook import close_workbooks
+        from hub_datatools.intervals import build_episode_intervals
+        from hub_datatools.keys import KeyRegistry
+        from hub_datatools.shards import DEFAULT_SHARDS, build_patient_shards, get_shard_count
+        from hub_datatools.text import build_text_indexes, has_text_indexes
+
+        # NOTE: data sources are independent from each other, so a failing one
+        # must not discard data already saved by the rest
+        # NOTE: entity identifiers are replaced by integer surrogate keys, whose
+        # mapping to the original identifiers is shared by all data sources
+        keys = KeyRegistry(args.datadir)
+
+        nerrors = 0
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = {executor.submit(_import_datasource, name, args, keys): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f'{name}: {e}')
+                    nerrors += 1
+
+        close_workbooks()
+
+        if nerrors > 0:
+            raise RuntimeError(f'{nerrors} data sources could not be imported')
+
+        # NOTE: indexes are built independently from each other, so that missing
+        # or inconsistent data only leaves out the indexes depending on it
+        if any(name in INDEXED_SOURCES for name in names):
+            index_builders = {
+                'episode intervals': build_episode_intervals,
+                'diagnosis codes': build_code_indexes,
+            }
+            for description, build_index in index_builders.items():
+                try:
+                    logging.info(f'Indexing {description}')
+                    build_index(args.datadir)
+                except FileNotFoundError as e:
+                    logging.warning(f'Skipped indexing {description}, as {e.filename} is missing')
+                except Exception as e:
+                    logging.error(f'Failed indexing {description}: {e}')
+
+        # NOTE: text indexes from previous imports are rebuilt along with the data
+        if args.text_index or has_text_indexes(args.datadir):
+            logging.info('Indexing free-text columns')
+            build_text_indexes(args.datadir)
+
+        # NOTE: shards from previous imports are rebuilt along with the data,
+        # keeping their number of shards unless a new one is given, and --shards
+        # alone uses the default number of shards
+        nshards = args.shards if args.shards is not None else get_shard_count(args.datadir)
+        if nshards == 0:
+            nshards = DEFAULT_SHARDS
+        if nshards is not None:
+            logging.info('Sharding patient data')
+            build_patient_shards(args.datadir, nshards)
+
         logging.info('Done')
 
     except Exception as e:
@@ -11,11 +11,16 @@ from pathlib import Path
 from argparse import ArgumentParser
 from typing import Any, Callable, Dict, Optional, Sequence
 
+import numpy as np
 import pandas as pd
-from pandas import DataFrame, Index, NamedAgg
+from pandas import DataFrame, Index, MultiIndex, NamedAgg, Series
 
 from hub_datatools import console
-from hub_datatools.serialize import load_data
+from hub_datatools.codes import CodeIndex, normalize_codes
+from hub_datatools.intervals import EpisodeIntervals
+from hub_datatools.keys import SURROGATE_KEYS, KeyRegistry, decode_keys
+from hub_datatools.serialize import StaleDataError, load_data
+from hub_datatools.text import TextIndex
 
 
 class Context:
@@ -52,9 +57,37 @@ class ExitEventLoop(Exception):
     pass
 
 
-def _try_eval_query(df: DataFrame, query: str) -> Optional[DataFrame]:
+# NOTE: comparisons of surrogate key fields against string literals, which are
+# given by the original identifiers and matched against their integer keys
+KEY_LITERAL_PATTERN = (r'\b(?P<field>' + '|'.join(SURROGATE_KEYS) + r')\s*'
+                       r'(?P<op>==|!=|\bnot\s+in\b|\bin\b)\s*'
+                       r'(?P<value>"[^"]*"|\'[^\']*\'|\[[^\]]*\]|\([^)]*\))')
+
+STRING_LITERAL_PATTERN = r'"([^"]*)"|\'([^\']*)\''
+
+
+def _encode_key_literals(console: 'Search', query: str) -> str:
+    datadir = console.get('DATADIR')
+    def load_keys(key): return KeyRegistry(datadir)
+    keys = _load_cached(console, 'keys', load_keys)
+
+    def encode_literals(match: re.Match) -> str:
+        value = match.group('value')
+        literals = [a or b for a, b in re.findall(STRING_LITERAL_PATTERN, value)]
+        codes = keys.find(match.group('field'), literals) if literals else None
+        if codes is None:
+            return match.group(0)
+
+        codes = iter(codes)
+        value = re.sub(STRING_LITERAL_PATTERN, lambda _: str(next(codes)), value)
+        return match.group(0)[:match.start('value') - match.start()] + value
+
+    return re.sub(KEY_LITERAL_PATTERN, encode_literals, query)
+
+
+def _try_eval_query(console: 'Search', df: DataFrame, query: str) -> Optional[DataFrame]:
     try:
-        return df.query(query)
+        return df.query(_encode_key_literals(console, query))
     except Exception as e:
         logging.error(f'Invalid query: {e.args[0]}')
         return None
@@ -89,6 +122,115 @@ def _load_cached(console: 'Search', key: str, fn: Callable[[], Any]) -> Any:
     return value
 
 
+def _get_field(records: DataFrame, name: str) -> Series:
+    if name in records.columns:
+        return records[name]
+    return Series(records.index.get_level_values(name), index=records.index)
+
+
+def _include_during(console: 'Search', records: DataFrame, args: Sequence[str]) -> Optional[Index]:
+    if len(args) == 0:
+        logging.error('Episodes data source not specified')
+        return None
+
+    name, field, *_ = args + ['fecha_visita']
+    try:
+        datadir = console.get('DATADIR')
+        def load_intervals(key): return EpisodeIntervals.load(datadir, name)
+        intervals = _load_cached(console, f'intervals/{name}', load_intervals)
+        matched = intervals.stab(_get_field(records, 'id_paciente'), _get_field(records, field))
+        return records.index[np.unique(matched['query'])]
+
+    except KeyError as e:
+        logging.error(f'Invalid fields: {e.args[0]}')
+        return None
+
+    except FileNotFoundError:
+        logging.error('Episode intervals do not exist')
+        return None
+
+    except (ValueError, StaleDataError) as e:
+        logging.error(f'Episode intervals could not be searched: {e}')
+        return None
+
+
+def _include_dx(console: 'Search', records: DataFrame, args: Sequence[str]) -> Optional[Index]:
+    if len(args) == 0:
+        logging.error('Diagnoses data source not specified')
+        return None
+
+    name, *patterns = args
+    if len(patterns) == 0:
+        logging.error('Diagnosis codes not specified')
+        return None
+
+    try:
+        datadir = console.get('DATADIR')
+        def load_codes(key): return CodeIndex.load(datadir, name)
+        codes = _load_cached(console, f'codes/{name}', load_codes)
+
+        # NOTE: records are matched by diagnosis if they have one, by episode if
+        # they have one, or else by patient
+        fields = list(records.columns) + list(records.index.names)
+        if 'id_episodio' in fields and 'codigo_dx' in fields:
+            found = codes.query(patterns)
+            found = MultiIndex.from_arrays([found.id_episodio, found.codigo])
+            keys = MultiIndex.from_arrays([_get_field(records, 'id_episodio'),
+                                           normalize_codes(_get_field(records, 'codigo_dx').to_numpy())])
+            matched = Series(keys.isin(found))
+        elif 'id_episodio' in fields:
+            matched = _get_field(records, 'id_episodio').isin(codes.episodes(patterns))
+        else:
+            matched = _get_field(records, 'id_paciente').isin(codes.patients(patterns))
+        return records.index[matched.to_numpy()]
+
+    except KeyError as e:
+        logging.error(f'Invalid fields: {e.args[0]}')
+        return None
+
+    except FileNotFoundError:
+        logging.error('Diagnosis codes index does not exist')
+        return None
+
+    except (ValueError, StaleDataError) as e:
+        logging.error(f'Diagnosis codes could not be searched: {e}')
+        return None
+
+
+def _include_text(console: 'Search', records: DataFrame, args: Sequence[str]) -> Optional[Index]:
+    if len(args) < 2:
+        logging.error('Data source and/or field not specified')
+        return None
+
+    name, column, *query = args
+    if len(query) == 0:
+        logging.error('Search terms not specified')
+        return None
+
+    try:
+        datadir = console.get('DATADIR')
+        def load_text(key): return TextIndex.load(datadir, name, column)
+        text = _load_cached(console, f'text/{name}/{column}', load_text)
+        matched = text.search(' '.join(query))
+        return records.index[records.index.isin(matched)]
+
+    except FileNotFoundError:
+        logging.error('Text index does not exist')
+        return None
+
+    except (ValueError, StaleDataError) as e:
+        logging.error(f'Text index could not be searched: {e}')
+        return None
+
+
+# NOTE: include conditions other than query expressions, given by their keyword
+INCLUDE_CONDITIONS = {
+    'during': _include_during,
+    'dx': _include_dx,
+    'text': _include_text,
+}
+
+
 class GroupByContext(Context):
 
     def __init__(self, key, records):
@@ -351,6 +493,10 @@ class GroupContext(Context):
         return 0
 
     def _include(self, console: 'Search', args: Sequence[str]) -> int:
+        if self._records is None:
+            logging.error('There are no records loaded yet')
+            return -1
+
         if len(args) == 0:
             logging.error('Include condition not specified')
             return -1
@@ -360,13 +506,20 @@ class GroupContext(Context):
             logging.info(f'Added all {len(self._records)} records to group')
             return 0
         else:
-            query = ' '.join(args)
-            matched = _try_eval_query(self._records, query)
-            if matched is None:
-                return -1
+            condition = INCLUDE_CONDITIONS.get(args[0])
+            if condition is not None:
+                matched = condition(console, self._records, args[1:])
+                if matched is None:
+                    return -1
+            else:
+                query = ' '.join(args)
+                matched = _try_eval_query(console, self._records, query)
+                if matched is None:
+                    return -1
+                matched = matched.index
 
             prevcount = len(self._included)
-            self._included = self._included.union(matched.index)
+            self._included = self._included.union(matched)
             self._included.names = self._records.index.names
             addcount = len(self._included) - prevcount
             logging.info(f'Found {len(matched)} matching records, {addcount} added')
@@ -385,7 +538,7 @@ class GroupContext(Context):
         else:
             query = ' '.join(args)
             records = self._records.loc[self._included]
-            matched = _try_eval_query(records, query)
+            matched = _try_eval_query(console, records, query)
             if matched is None:
                 return -1
 
@@ -431,6 +584,9 @@ class GroupContext(Context):
         logging.info('- show'.ljust(PADDING, ' ') + 'Show records in group')
         logging.info('- showcols'.ljust(PADDING, ' ') + 'Show columns from records')
         logging.info('- include <all | expr>'.ljust(PADDING, ' ') + 'Add matching records')
+        logging.info('- include during <episodes> [field]'.ljust(PADDING, ' ') + 'Add records dated within episodes')
+        logging.info('- include dx <diagnoses> <codes>...'.ljust(PADDING, ' ') + 'Add records with diagnosis codes')
+        logging.info('- include text <datafile> <field> <terms>...'.ljust(PADDING, ' ') + 'Add records with text terms')
         logging.info('- exclude <all | expr>'.ljust(PADDING, ' ') + 'Remove matching records')
         logging.info('- save'.ljust(PADDING, ' ') + 'Save records and leave context')
 
@@ -525,6 +681,9 @@ class GlobalContext(Context):
                 logging.error(f'Group {groupname} does not exist')
                 return -1
 
+            # NOTE: surrogate keys are translated back to the original identifiers
+            records = decode_keys(console.get('DATADIR'), records)
+
             match console.get('OUTPUTFORMAT'):
                 case 'csv':
                     path = path.with_suffix('.csv')
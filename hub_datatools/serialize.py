@@ -1,13 +1,69 @@
+import hashlib
+import logging
 import pickle
+import uuid
 
 from pathlib import Path
-from typing  import Any, Dict, Optional
+from typing  import Any, BinaryIO, Callable, Dict, Optional, Sequence
+
+
+FINGERPRINT_ATTR = 'fingerprint'
+
+SORTED_INDEX_ATTR = 'sorted_index'
+
+
+class StaleDataError(RuntimeError):
+	pass
+
+
+def _sort_by_index(data: Any) -> Any:
+	# NOTE: tables are stored in index order, and tagged with whether their index
+	# is unique, so that loading them does not need any sorting again
+	if not hasattr(data, 'sort_index'):
+		return data
+
+	if data.index.is_monotonic_increasing:
+		data = data.copy(deep=False)
+	else:
+		try:
+			data = data.sort_index(kind='stable')
+		except TypeError:
+			return data
+
+	data.attrs[SORTED_INDEX_ATTR] = {'unique': data.index.is_unique}
+	return data
+
+
+def _restore_index_order(data: Any) -> Any:
+	if not hasattr(data, 'sort_index') or SORTED_INDEX_ATTR not in data.attrs:
+		return data
+
+	if not data.index.is_monotonic_increasing:
+		data = data.sort_index(kind='stable')
+	data.attrs[SORTED_INDEX_ATTR] = {'unique': data.index.is_unique}
+	return data
 
 
 def load_data(datadir: Path, name: str) -> Any:
 	path = Path(datadir).joinpath(f'{name}.pickle')
 	with open(path, 'rb') as f:
-		return pickle.load(f)
+		chunks = []
+		while True:
+			try:
+				chunks.append(pickle.load(f))
+			except EOFError:
+				break
+
+	if len(chunks) == 1:
+		return chunks[0]
+
+	# NOTE: chunks are stored sorted each on their own, so they only need to be
+	# merged back into index order when loaded together
+	import pandas as pd
+	data = pd.concat(chunks)
+	if hasattr(chunks[0], 'attrs') and SORTED_INDEX_ATTR in chunks[0].attrs:
+		data.attrs[SORTED_INDEX_ATTR] = chunks[0].attrs[SORTED_INDEX_ATTR]
+	return _restore_index_order(data)
 
 
 def try_load_data(datadir: Path, name: str) -> Optional[Any]:
@@ -17,10 +73,81 @@ def try_load_data(datadir: Path, name: str) -> Optional[Any]:
 		return None
 
 
-def save_data(datadir: Path, data: Dict[str, Any], replace: bool = False) -> None:
-	for name, df in data.items():
-		mode = 'wb' if replace else 'xb'
-		path = Path(datadir).joinpath(f'{name}.pickle')
+class SnapshotWriter:
+
+	def __init__(self, datadir: Path, replace: bool = False):
+		self._datadir = Path(datadir)
+		self._replace = replace
+		self._files: Dict[str, BinaryIO] = {}
+
+	def _path(self, name: str) -> Path:
+		return self._datadir.joinpath(f'{name}.pickle')
+
+	def _open(self, name: str) -> BinaryIO:
+		path = self._path(name)
+		if path.exists() and not self._replace:
+			raise FileExistsError(f'Snapshot data "{name}" already exists')
+
+		# NOTE: data is written to a temporary file unique to this writer, which
+		# replaces the previous one at once, so concurrent writers never mix
 		path.parent.mkdir(parents=True, exist_ok=True)
-		with open(path, mode) as f:
-			pickle.dump(df, f)
+		tmppath = path.with_name(f'{path.stem}.{uuid.uuid4().hex}.tmp')
+		f = self._files[name] = open(tmppath, 'xb')
+		return f
+
+	def write(self, name: str, data: Any) -> None:
+		# NOTE: writing several times to the same name appends chunks to it,
+		# which are concatenated back together when loaded
+		f = self._files.get(name) or self._open(name)
+		data = _sort_by_index(data)
+		pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+	def close(self, commit: bool = True) -> None:
+		for name, f in self._files.items():
+			f.close()
+			tmppath = Path(f.name)
+			if commit:
+				tmppath.replace(self._path(name))
+			else:
+				tmppath.unlink(missing_ok=True)
+		self._files.clear()
+
+	def __enter__(self) -> 'SnapshotWriter':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close(commit=exc_type is None)
+
+
+def save_data(datadir: Path, data: Dict[str, Any], replace: bool = False) -> None:
+	with SnapshotWriter(datadir, replace=replace) as writer:
+		for name, df in data.items():
+			writer.write(name, df)
+
+
+def data_stamp(datadir: Path, names: Sequence[str]) -> str:
+	# NOTE: stamps are taken from file metadata only, which changes whenever a
+	# table is written again, so they are cheap to check
+	h = hashlib.sha256()
+	for name in names:
+		stat = Path(datadir).joinpath(f'{name}.pickle').stat()
+		h.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+	return h.hexdigest()
+
+
+def load_materialized_data(datadir: Path, name: str, inputs: Sequence[str],
+                           build: Callable[[], Any], version: str = '') -> Any:
+	# NOTE: materialized data is tagged with the stamp of the snapshot data and the
+	# code version it was built from, and is only rebuilt when any of them changes
+	fingerprint = f'{version}:{data_stamp(datadir, inputs)}'
+	data = try_load_data(datadir, name)
+	if data is not None and data.attrs.get(FINGERPRINT_ATTR) == fingerprint:
+		return data
+
+	data = build()
+	data.attrs[FINGERPRINT_ATTR] = fingerprint
+	try:
+		save_data(datadir, {name: data}, replace=True)
+	except OSError as e:
+		logging.warning(f'Materialized data "{name}" could not be saved: {e}')
+	return data
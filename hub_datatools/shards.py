@@ -0,0 +1,155 @@
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+from pandas.api.types import is_integer_dtype
+
+from hub_datatools.keys import KeyRegistry
+from hub_datatools.lookup import load_lookup, lookup_values
+from hub_datatools.serialize import StaleDataError, data_stamp, load_data, save_data, try_load_data
+
+SHARDS_PREFIX = 'shards'
+
+SHARDS_INDEX = f'{SHARDS_PREFIX}/index'
+
+DEFAULT_SHARDS = 64
+
+# NOTE: tables are sharded by patient, either by a patient id column or index
+# level, or by an identifier linked to patients through a lookup, and are given
+# the date used to place their records in patient timelines
+SHARDED_TABLES = {
+    'ufmn/patients': {'date': None},
+    'ufmn/alsfrs': {'date': 'fecha_visita'},
+    'ufmn/nutr': {'date': 'fecha_visita'},
+    'ufmn/resp': {'date': 'fecha_visita'},
+    'hub_urg/episodes': {'date': 'inicio_episodio', 'lookup': 'nhc'},
+    'hub_hosp/episodes': {'date': 'inicio_episodio', 'lookup': 'nhc'},
+}
+
+PATIENT_ID_COLUMN = 'id_paciente'
+
+
+def _shard_name(name: str, shard: int) -> str:
+    return f'{SHARDS_PREFIX}/{name}/{shard}'
+
+
+def _patient_shards(ids: Any, nshards: int) -> np.ndarray:
+    ids = Series(ids)
+    values = ids.to_numpy('int64') if is_integer_dtype(ids.dtype) else ids.to_numpy(object)
+    return (pd.util.hash_array(values) % nshards).astype('int64')
+
+
+def _patient_ids(datadir: Path, df: DataFrame, spec: Dict[str, Any]) -> Series:
+    if PATIENT_ID_COLUMN in df.columns:
+        return df[PATIENT_ID_COLUMN]
+    if PATIENT_ID_COLUMN in df.index.names:
+        return Series(df.index.get_level_values(PATIENT_ID_COLUMN), index=df.index)
+    lookup = load_lookup(datadir, spec['lookup'])
+    return lookup_values(lookup, df[spec['lookup']], validate='many_to_one')
+
+
+def build_patient_shards(datadir: Path, nshards: int = DEFAULT_SHARDS) -> None:
+    tables = {}
+    for name, spec in SHARDED_TABLES.items():
+        df = try_load_data(datadir, name)
+        if df is None:
+            continue
+
+        ids = _patient_ids(datadir, df, spec)
+        if PATIENT_ID_COLUMN not in df.columns and PATIENT_ID_COLUMN not in df.index.names:
+            df = df.assign(**{PATIENT_ID_COLUMN: ids.array})
+
+        # NOTE: rows are grouped by shard with a single stable sort, so that each
+        # shard is written from a contiguous slice of the table
+        known = ids.notna().to_numpy()
+        shards = np.full(len(df), -1)
+        shards[known] = _patient_shards(ids[known], nshards)
+        order = np.argsort(shards, kind='stable')
+        bounds = np.searchsorted(shards[order], np.arange(nshards + 1))
+
+        data = {}
+        for shard in range(nshards):
+            data[_shard_name(name, shard)] = df.iloc[order[bounds[shard]:bounds[shard + 1]]]
+        save_data(datadir, data, replace=True)
+        tables[name] = spec
+
+    # NOTE: shards are stamped with the tables they were built from, so that
+    # shards left behind by later imports are not loaded
+    index = {'nshards': nshards, 'tables': tables, 'stamp': data_stamp(datadir, list(tables))}
+    save_data(datadir, {SHARDS_INDEX: index}, replace=True)
+
+
+def get_shard_count(datadir: Path) -> Optional[int]:
+    index = try_load_data(datadir, SHARDS_INDEX)
+    return index['nshards'] if index is not None else None
+
+
+class PatientShards:
+
+    def __init__(self, datadir: Path, index: Dict[str, Any]):
+        self._datadir = datadir
+        self._index = index
+        self._keys = KeyRegistry(datadir)
+
+    @staticmethod
+    def load(datadir: Path) -> 'PatientShards':
+        index = try_load_data(datadir, SHARDS_INDEX)
+        if index is None:
+            raise FileNotFoundError('Snapshot data is not sharded by patient')
+
+        try:
+            stamp = data_stamp(datadir, list(index['tables']))
+        except FileNotFoundError:
+            stamp = None
+        if stamp != index.get('stamp'):
+            raise StaleDataError('Patient shards are outdated, rebuild them with dt-import --shards')
+        return PatientShards(datadir, index)
+
+    def _encode_patient_id(self, id: Any) -> Any:
+        # NOTE: patients can be given by their original id when the snapshot uses
+        # surrogate keys, which are looked up through the key registry
+        if isinstance(id, (int, np.integer)):
+            return id
+
+        codes = self._keys.find(PATIENT_ID_COLUMN, [id])
+        if codes is None:
+            return id
+        if codes[0] == -1:
+            raise KeyError(f'Unknown patient: {id}')
+        return int(codes[0])
+
+    def _load_patient_data(self, id: Any) -> Dict[str, DataFrame]:
+        id = self._encode_patient_id(id)
+        shard = _patient_shards([id], self._index['nshards'])[0]
+
+        results = {}
+        for name in self._index['tables'].keys():
+            df = load_data(self._datadir, _shard_name(name, shard))
+            if PATIENT_ID_COLUMN in df.columns:
+                results[name] = df[df[PATIENT_ID_COLUMN] == id]
+            else:
+                results[name] = df[df.index.get_level_values(PATIENT_ID_COLUMN) == id]
+        return results
+
+    def patient(self, id: Any) -> DataFrame:
+        # NOTE: only the shard holding the patient is read from each table
+        data = self._load_patient_data(id)
+
+        frames = {}
+        for name, df in data.items():
+            date = self._index['tables'][name]['date']
+            df = df.reset_index()
+            df.insert(0, 'fecha', pd.to_datetime(df[date]) if date is not None else pd.NaT)
+            frames[name] = df
+
+        if not frames:
+            return DataFrame()
+
+        timeline = pd.concat(frames, names=['origen', None]).reset_index(level='origen')
+        return timeline.sort_values('fecha', kind='stable', na_position='first').reset_index(drop=True)
+
+
+def load_patient(datadir: Path, id: Any) -> DataFrame:
+    return PatientShards.load(datadir).patient(id)
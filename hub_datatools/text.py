@@ -0,0 +1,132 @@
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from pandas import DataFrame, Index, Series
+from pandas.api.types import is_object_dtype, is_string_dtype
+
+from hub_datatools.serialize import StaleDataError, data_stamp, load_data, save_data, try_load_data
+
+TEXT_PREFIX = 'text'
+
+# NOTE: free-text columns indexed for each snapshot table, where None stands for
+# every text column of the table
+TEXT_INDEX_COLUMNS = {
+    'hub_urg/diagnoses': ['descripcion_dx'],
+    'hub_hosp/diagnoses': ['descripcion_dx'],
+    'ufmn/patients': ['estudio_genetico_otro'],
+    'edmus/comment': None,
+}
+
+TOKEN_PATTERN = r'\w+'
+
+QUERY_PATTERN = r'"([^"]*)"|(\S+)'
+
+
+def _text_name(name: str, column: str) -> str:
+    return f'{TEXT_PREFIX}/{name}/{column}'
+
+
+def normalize_text(data: Series) -> Series:
+    # NOTE: accents are removed by decomposing characters and dropping the
+    # combining marks, which are not ASCII
+    return (data.astype(object).str.normalize('NFKD')
+            .str.encode('ascii', errors='ignore').str.decode('ascii').str.lower())
+
+
+def tokenize_text(text: str) -> List[str]:
+    return normalize_text(Series([text])).str.findall(TOKEN_PATTERN).iloc[0]
+
+
+def _build_text_index(data: Series, stamp: str) -> Dict[str, Any]:
+    tokens = normalize_text(data.reset_index(drop=True)).str.findall(TOKEN_PATTERN).explode().dropna()
+    positions = tokens.groupby(level=0).cumcount()
+    postings = DataFrame({
+        'token': tokens.to_numpy(dtype=str),
+        'row': tokens.index.to_numpy(dtype='int64'),
+        'pos': positions.to_numpy(dtype='int64'),
+    }).sort_values(['token', 'row', 'pos'], kind='stable', ignore_index=True)
+    return {'rows': data.index, 'postings': postings, 'stamp': stamp}
+
+
+def _text_columns(df: DataFrame, columns: Optional[Sequence[str]]) -> List[str]:
+    if columns is None:
+        return [col for col in df.columns if is_object_dtype(df[col]) or is_string_dtype(df[col])]
+    return [col for col in columns if col in df.columns]
+
+
+def build_text_indexes(datadir: Path) -> None:
+    for name, columns in TEXT_INDEX_COLUMNS.items():
+        df = try_load_data(datadir, name)
+        if df is None:
+            continue
+
+        # NOTE: indexes are stamped with the table they were built from, so that
+        # indexes left behind by later imports are not searched
+        stamp = data_stamp(datadir, [name])
+        data = {_text_name(name, col): _build_text_index(df[col], stamp)
+                for col in _text_columns(df, columns)}
+        save_data(datadir, data, replace=True)
+
+
+def has_text_indexes(datadir: Path) -> bool:
+    return Path(datadir).joinpath(TEXT_PREFIX).is_dir()
+
+
+class TextIndex:
+
+    def __init__(self, index: Dict[str, Any]):
+        self._rows: Index = index['rows']
+        postings = index['postings']
+        self._tokens = postings.token.to_numpy(dtype=str)
+        self._postings_rows = postings.row.to_numpy()
+        self._postings_pos = postings.pos.to_numpy()
+
+    @staticmethod
+    def load(datadir: Path, name: str, column: str) -> 'TextIndex':
+        index = load_data(datadir, _text_name(name, column))
+        if index.get('stamp') != data_stamp(datadir, [name]):
+            raise StaleDataError(f'Text index for "{name}" is outdated, rebuild it with dt-import --text-index')
+        return TextIndex(index)
+
+    def _postings(self, token: str) -> slice:
+        # NOTE: postings are sorted by token, so the postings of a term, or of
+        # every term starting with a prefix, are a contiguous range
+        if token.endswith('*'):
+            token = token[:-1]
+            hi = np.searchsorted(self._tokens, token + '\U0010ffff', side='left')
+        else:
+            hi = np.searchsorted(self._tokens, token, side='right')
+        return slice(np.searchsorted(self._tokens, token, side='left'), hi)
+
+    def _match_term(self, term: str) -> np.ndarray:
+        return np.unique(self._postings_rows[self._postings(term)])
+
+    def _match_phrase(self, terms: Sequence[str]) -> np.ndarray:
+        # NOTE: a phrase matches where each of its terms appears right after the
+        # previous one, which is found intersecting (row, position - offset) keys
+        width = int(self._postings_pos.max(initial=0)) + len(terms) + 1
+        keys = None
+        for offset, term in enumerate(terms):
+            span = self._postings(term)
+            term_keys = self._postings_rows[span] * width + (self._postings_pos[span] - offset + len(terms))
+            keys = term_keys if keys is None else np.intersect1d(keys, term_keys)
+        return np.unique(keys // width)
+
+    def search(self, query: str) -> Index:
+        rows = None
+        for phrase, term in re.findall(QUERY_PATTERN, query):
+            suffix = '*' if term.endswith('*') else ''
+            terms = tokenize_text(phrase if phrase else term)
+            if len(terms) == 0:
+                continue
+            if len(terms) == 1:
+                matched = self._match_term(terms[0] + suffix)
+            else:
+                matched = self._match_phrase(terms)
+            rows = matched if rows is None else np.intersect1d(rows, matched)
+
+        if rows is None:
+            return self._rows[:0]
+        return self._rows[rows]
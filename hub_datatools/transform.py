@@ -1,4 +1,5 @@
-from typing import Dict, Iterable, Optional, Protocol
+import re
+from typing import Dict, Iterable, Optional, Protocol, Tuple
 
 import pandas as pd
 from pandas import DataFrame, Series
@@ -80,6 +81,47 @@ def transform_cast(type: str) -> TransformFn:
     return lambda df, **kwargs: df.astype(type)
 
 
+def decode_list_field(data: Series, categories: Dict[str, Dict[str, str]], sep: str = '@',
+                      maxitems: int = None) -> DataFrame:
+    items = data.str.split(sep)
+    if maxitems is not None:
+        items = items.str[:maxitems]
+    items = items.explode()
+
+    # NOTE: every item is looked up once against a joint table holding all category
+    # mappings, then the last matching item of each list wins for every category
+    lookup = DataFrame(categories)
+    decoded = lookup.reindex(items.values)
+    decoded.index = items.index
+    return decoded.groupby(level=0, sort=False).last().reindex(data.index)
+
+
+def extract_list_field_status(data: Series, rules: Dict[str, Tuple[str, Dict[str, str]]],
+                              sep: str = '@', case: bool = False) -> DataFrame:
+    # NOTE: each rule is a subject pattern followed by outcome patterns that must appear
+    # later in the same list item, all compiled into a single alternation so that the
+    # column is scanned once; outcomes are zero-width lookaheads so that consecutive
+    # subjects in one item are still matched, and later outcomes take precedence
+    alternatives = []
+    for i, (subject, outcomes) in enumerate(rules.values()):
+        lookaheads = ''.join(f'(?:(?=[^{sep}]+(?P<r{i}_{j}>{outcome})))?'
+                             for j, outcome in enumerate(outcomes.keys()))
+        alternatives.append(f'(?P<r{i}>{subject}){lookaheads}')
+
+    flags = 0 if case else re.IGNORECASE
+    matches = data.str.extractall('|'.join(alternatives), flags=flags)
+
+    result = DataFrame(index=data.index)
+    for i, (name, (_, outcomes)) in enumerate(rules.items()):
+        status = Series(None, index=data.index, dtype=object)
+        for j, value in enumerate(outcomes.values()):
+            found = matches[f'r{i}_{j}'].notna().groupby(level=0).any()
+            status[found[found].index] = value
+        result[name] = status.astype('category')
+
+    return result
+
+
 def apply_transform_pipeline(df: DataFrame, field: str, pipeline: Iterable[TransformFn],
                              inplace: bool | str = False, **kwargs) -> DataFrame:
     data = df[field]
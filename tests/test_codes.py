@@ -0,0 +1,37 @@
+import pandas as pd
+
+from hub_datatools.codes import CodeIndex, build_code_indexes
+from hub_datatools.serialize import save_data
+
+
+def _make_hub_snapshot(datadir):
+    episodes = pd.DataFrame({
+        'id_episodio': [1, 2],
+        'nhc': ['100', '200'],
+    }).set_index('id_episodio')
+    diagnoses = pd.DataFrame({
+        'id_episodio': [1, 1, 2],
+        'codigo_dx': ['G12.21', 'J96.0', '335.2'],
+    }).set_index(['id_episodio', 'codigo_dx'])
+    save_data(datadir, {'hub_urg/episodes': episodes, 'hub_urg/diagnoses': diagnoses})
+
+
+def test_code_index_without_patients(tmp_path):
+    _make_hub_snapshot(tmp_path)
+    build_code_indexes(tmp_path)
+
+    index = CodeIndex.load(tmp_path, 'hub_urg/diagnoses')
+    assert list(index.episodes(['G12*', 'J960'])) == [1]
+    assert list(index.episodes(['3352'])) == [2]
+    assert len(index.patients(['G12*'])) == 0
+
+
+def test_code_index_with_patients(tmp_path):
+    _make_hub_snapshot(tmp_path)
+    patients = pd.DataFrame({'id_paciente': [7, 8], 'nhc': ['100', '200']}).set_index('id_paciente')
+    save_data(tmp_path, {'ufmn/patients': patients})
+    build_code_indexes(tmp_path)
+
+    index = CodeIndex.load(tmp_path, 'hub_urg/diagnoses')
+    assert list(index.patients(['G12*'])) == [7]
+    assert list(index.patients(['3352'])) == [8]
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from hub_datatools.datasources.edmus import _merge_edmus_sites, _select_site_rows
+
+
+def _make_site(patients, sexes):
+    return pd.DataFrame({
+        'patient_id': patients,
+        'sex': pd.Categorical(sexes),
+        'ms_course': pd.Categorical(['RR'] * len(patients)),
+    })
+
+
+def test_merge_sites_keeps_categories():
+    frames = {
+        'B': _make_site([3], ['X']),
+        'A': _make_site([1, 2], ['F', 'M']),
+    }
+    df = _merge_edmus_sites(frames, 'patient_id')
+
+    assert isinstance(df.sex.dtype, pd.CategoricalDtype)
+    assert set(df.sex.cat.categories) == {'F', 'M', 'X'}
+    assert isinstance(df.ms_course.dtype, pd.CategoricalDtype)
+    assert list(df.index) == [('A', 1), ('A', 2), ('B', 3)]
+    assert list(df.sex) == ['F', 'M', 'X']
+
+
+def test_merge_reused_site_keeps_categories():
+    previous = _merge_edmus_sites({'A': _make_site([1, 2], ['F', 'M'])}, 'patient_id')
+    frames = {
+        'A': _select_site_rows(previous, 'A'),
+        'B': _make_site([3], ['X']).drop(columns='ms_course'),
+    }
+    df = _merge_edmus_sites(frames, 'patient_id')
+
+    assert isinstance(df.sex.dtype, pd.CategoricalDtype)
+    assert isinstance(df.ms_course.dtype, pd.CategoricalDtype)
+    assert list(df.ms_course.isna()) == [False, False, True]
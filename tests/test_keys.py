@@ -0,0 +1,66 @@
+import pandas as pd
+
+from hub_datatools.keys import KeyRegistry, decode_keys
+from hub_datatools.lookup import build_lookups
+from hub_datatools.projects import get_project_class
+from hub_datatools.serialize import load_data, save_data
+
+
+ALSFRS_ITEMS = [
+    'lenguaje', 'salivacion', 'deglucion', 'escritura', 'cortar_con_peg', 'cortar_sin_peg',
+    'vestido', 'cama', 'caminar', 'subir_escaleras', 'disnea', 'ortopnea', 'insuf_resp',
+]
+
+
+def _make_snapshot(datadir):
+    keys = KeyRegistry(datadir)
+    patients = pd.DataFrame({
+        'id_paciente': ['p-a', 'p-b', 'p-c'],
+        'nhc': ['100', '200', '300'],
+        'fecha_dx': pd.to_datetime(['2020-01-01', '2020-02-01', None]),
+        'fecha_exitus': pd.to_datetime([None, None, None]),
+        'municipio_residencia': ['Barcelona', 'Girona', 'Lleida'],
+        'provincia_residencia': ['Barcelona', 'Girona', 'Lleida'],
+        'codigo_postal': ['08001', '17001', '25001'],
+    }).set_index('id_paciente')
+
+    alsfrs = pd.DataFrame({item: [4, 3] for item in ALSFRS_ITEMS})
+    alsfrs['id_paciente'] = ['p-a', 'p-b']
+    alsfrs['fecha_visita'] = pd.to_datetime(['2020-03-01', '2020-04-01'])
+    alsfrs['portador_peg'] = [False, False]
+    alsfrs['indicacion_peg'] = [False, False]
+    visits = alsfrs[['id_paciente', 'fecha_visita']]
+
+    data = {
+        'ufmn/patients': keys.encode_frame(patients),
+        'ufmn/alsfrs': keys.encode_frame(alsfrs),
+        'ufmn/nutr': keys.encode_frame(visits.assign(peso=[70.0, 80.0])),
+        'ufmn/resp': keys.encode_frame(visits.assign(fvc_sentado=[90.0, 85.0])),
+    }
+    data.update(build_lookups('ufmn/patients', data['ufmn/patients']))
+    keys.save()
+    save_data(datadir, data)
+
+
+def test_export_als_geo(tmp_path):
+    _make_snapshot(tmp_path)
+    project = get_project_class('als-geo')(datadir=tmp_path)
+    data = project.export_data()
+
+    towns = data['Municipio']
+    assert isinstance(towns, pd.Series)
+    assert towns.to_dict() == {'Barcelona': 1, 'Girona': 1}
+
+
+def test_decode_series_snapshot(tmp_path):
+    _make_snapshot(tmp_path)
+    lookup = load_data(tmp_path, 'lookup/nhc')
+    assert isinstance(lookup, pd.Series)
+
+    decoded = decode_keys(tmp_path, lookup)
+    assert decoded.name == 'id_paciente'
+    assert decoded.to_dict() == {'100': 'p-a', '200': 'p-b', '300': 'p-c'}
+
+
+def test_decode_other_data(tmp_path):
+    assert decode_keys(tmp_path, {'nshards': 4}) == {'nshards': 4}
@@ -0,0 +1,28 @@
+import os
+
+import pandas as pd
+
+from hub_datatools.serialize import load_materialized_data, save_data
+
+
+def test_materialized_data_rebuilt_on_input_change(tmp_path):
+    save_data(tmp_path, {'ufmn/alsfrs': pd.DataFrame({'x': [1, 2]})})
+    builds = []
+
+    def build():
+        builds.append(None)
+        return pd.DataFrame({'y': [len(builds)]})
+
+    load_materialized_data(tmp_path, 'ufmn/derived', ['ufmn/alsfrs'], build, version='1')
+    data = load_materialized_data(tmp_path, 'ufmn/derived', ['ufmn/alsfrs'], build, version='1')
+    assert len(builds) == 1
+    assert list(data.y) == [1]
+
+    path = tmp_path.joinpath('ufmn/alsfrs.pickle')
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    data = load_materialized_data(tmp_path, 'ufmn/derived', ['ufmn/alsfrs'], build, version='1')
+    assert list(data.y) == [2]
+
+    data = load_materialized_data(tmp_path, 'ufmn/derived', ['ufmn/alsfrs'], build, version='2')
+    assert list(data.y) == [3]